@@ -1 +1,4 @@
 from .main import DiskQueue
+from .pool import WorkerPool
+from .cache import ChunkCache
+from .selector import QueueSelector
@@ -0,0 +1,145 @@
+import threading
+import weakref
+from collections import OrderedDict
+
+
+class ChunkCache:
+    """
+    Memory cache of packed chunks shared by many DiskQueue instances under a
+    single global byte budget.
+
+    Queues created with a `chunk_cache` hand their full put buffers to the
+    cache instead of writing a chunk file, & take them back on get(). While
+    the packed chunks of all registered queues fit in `budget_bytes` nothing
+    touches the disk, once the budget is exceeded chunks of the least
+    recently used queue are spilled to their chunk files, newest chunk first
+    since it will be read last.
+
+    Chunks held in the cache are as volatile as the memory put buffer until
+    they are spilled or the queue is sync()'ed / closed. Queues are only
+    weakly referenced, the chunks of a queue dropped without close() are
+    discarded with it like on a crash.
+    """
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.size = 0
+        self.hits = 0
+        self.spills = 0
+
+        self._lock = threading.Lock()
+        # weakref(queue) -> {chunk index: (payload, item count)}, least
+        # recently used first
+        self._queues = OrderedDict()
+        # References of collected queues, removed from `_queues` on the next
+        # call since the weakref callback may run while `_lock` is held.
+        self._dead = []
+
+    def _purge(self):
+        # Must be called with `self._lock` held.
+        while self._dead:
+            chunks = self._queues.pop(self._dead.pop(), {})
+            self.size -= sum(len(payload) for payload, count in chunks.values())
+
+    def _chunks(self, queue):
+        # Must be called with `self._lock` held.
+        self._purge()
+        try:
+            return self._queues[weakref.ref(queue)]
+        except KeyError:
+            raise ValueError('queue is not registered with this ChunkCache, was it closed?') from None
+
+    def register(self, queue):
+        with self._lock:
+            self._purge()
+            self._queues.setdefault(weakref.ref(queue, self._dead.append), {})
+
+    def unregister(self, queue):
+        """ Spill every chunk of `queue` & stop tracking it, `queue.mutex` must be held"""
+        self.flush(queue)
+        with self._lock:
+            self._queues.pop(weakref.ref(queue), None)
+
+    def store(self, queue, index, payload, count):
+        """
+        Keep the packed chunk `index` of `queue` in memory, spilling chunks of
+        other queues if the budget is exceeded. `queue.mutex` must be held.
+        """
+        with self._lock:
+            self._chunks(queue)[index] = (payload, count)
+            self._queues.move_to_end(weakref.ref(queue))
+            self.size += len(payload)
+        self._evict(queue)
+
+    def pop(self, queue, index):
+        """ Remove & return the (payload, count) of a cached chunk or None"""
+        with self._lock:
+            entry = self._chunks(queue).pop(index, None)
+            self._queues.move_to_end(weakref.ref(queue))
+            if entry is not None:
+                self.size -= len(entry[0])
+                self.hits += 1
+            return entry
+
+    def get(self, queue, index):
+        """ Return the (payload, count) of a cached chunk without removing it or None"""
+        with self._lock:
+            return self._chunks(queue).get(index)
+
+    def flush(self, queue):
+        """ Spill every cached chunk of `queue` to disk, `queue.mutex` must be held"""
+        with self._lock:
+            chunks = self._chunks(queue)
+            self._queues[weakref.ref(queue)] = {}
+            self.size -= sum(len(payload) for payload, count in chunks.values())
+            self.spills += len(chunks)
+
+        if chunks:
+            queue._spill_chunks([(index, payload, count) for index, (payload, count) in sorted(chunks.items())])
+
+    def _pick_victim(self, owner):
+        # Must be called with `self._lock` held. Queue mutexes are only ever
+        # try-acquired here so that two queues spilling each other's chunks
+        # can never deadlock, busy queues are skipped.
+        self._purge()
+        for ref, chunks in self._queues.items():
+            queue = ref()
+            if queue is None or not chunks:
+                continue
+            if queue is not owner and not queue.mutex.acquire(blocking=False):
+                continue
+            index = max(chunks)
+            payload, count = chunks.pop(index)
+            self.size -= len(payload)
+            self.spills += 1
+            return queue, index, payload, count
+        return None
+
+    def _evict(self, owner):
+        while True:
+            with self._lock:
+                if self.size <= self.budget_bytes:
+                    return
+                victim = self._pick_victim(owner)
+            if victim is None:
+                # Every queue holding chunks is busy, stay over budget until
+                # the next store().
+                return
+
+            queue, index, payload, count = victim
+            try:
+                queue._spill_chunk(index, payload, count)
+            finally:
+                if queue is not owner:
+                    queue.mutex.release()
+
+    def stats(self):
+        with self._lock:
+            self._purge()
+            return {
+                'queues': len(self._queues),
+                'size': self.size,
+                'budget_bytes': self.budget_bytes,
+                'hits': self.hits,
+                'spills': self.spills,
+            }
@@ -0,0 +1,112 @@
+import os
+import errno
+import mmap
+
+# msgpack is imported on first use by pack_chunk() / unpack_chunk(), so that
+# importing the package stays cheap for processes that only open queues.
+
+
+BUFFERED = 'buffered'
+PREALLOCATED = 'preallocated'
+DIRECT = 'direct'
+
+IO_MODES = (BUFFERED, PREALLOCATED, DIRECT)
+
+# Chunk files are allocated in multiples of this size in the preallocated &
+# direct modes, O_DIRECT requires both the file offset & length to be aligned.
+BLOCK_SIZE = 4096
+
+# No. of consumed chunk files a queue keeps for reuse in the preallocated &
+# direct modes.
+SPARE_CHUNKS = 4
+
+_fdatasync = getattr(os, 'fdatasync', os.fsync)
+_O_DIRECT = getattr(os, 'O_DIRECT', 0)
+
+
+def _align(size):
+    return max(BLOCK_SIZE, (size + BLOCK_SIZE - 1) // BLOCK_SIZE * BLOCK_SIZE)
+
+
+def sync_fd(fd, io_mode=BUFFERED):
+    """
+    Flush `fd` to disk, the buffered mode does a full fsync whereas the other
+    modes skip the metadata only updates by using fdatasync where available.
+    """
+    if io_mode == BUFFERED:
+        os.fsync(fd)
+    else:
+        _fdatasync(fd)
+
+
+def _write_in_place(file_name, payload, direct):
+    size = _align(len(payload))
+    flags = os.O_WRONLY | os.O_CREAT
+    if direct:
+        flags |= _O_DIRECT
+
+    fd = os.open(file_name, flags, 0o644)
+    try:
+        # A reused chunk file already owns enough blocks, only a new (or
+        # smaller) file is extended, so the file size & block map do not
+        # change & fdatasync has no metadata to write.
+        if hasattr(os, 'posix_fallocate') and os.fstat(fd).st_size < size:
+            os.posix_fallocate(fd, 0, size)
+
+        if direct:
+            # O_DIRECT needs a page aligned source buffer, anonymous mmaps are.
+            with mmap.mmap(-1, size) as buf:
+                buf[:len(payload)] = payload
+                os.write(fd, buf)
+        else:
+            os.write(fd, payload)
+
+        _fdatasync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_chunk(file_name, payload, io_mode=BUFFERED):
+    """
+    Write the packed chunk `payload` to `file_name` & flush it to disk.
+
+    In the preallocated & direct modes an existing file is overwritten in
+    place rather than truncated, bytes past the payload are left as they are
+    & ignored when the chunk is read. Queues rename a consumed chunk file to
+    `file_name` first, so its blocks are reused, other files get their blocks
+    reserved with posix_fallocate. The direct mode writes a block aligned
+    buffer & bypasses the page cache with O_DIRECT when the filesystem
+    supports it.
+    """
+    if io_mode == BUFFERED:
+        with open(file_name, 'wb+') as fp:
+            fp.write(payload)
+            fp.flush()
+            os.fsync(fp.fileno())
+        return
+
+    direct = io_mode == DIRECT and bool(_O_DIRECT)
+    try:
+        _write_in_place(file_name, payload, direct)
+    except OSError as e:
+        # tmpfs & some network filesystems refuse O_DIRECT with EINVAL.
+        if not direct or e.errno != errno.EINVAL:
+            raise
+        _write_in_place(file_name, payload, False)
+
+
+def pack_chunk(objects):
+    """ Encode a list of objects into a chunk payload"""
+    import msgpack
+    return msgpack.packb(objects)
+
+
+def unpack_chunk(data):
+    """
+    Decode a chunk read from disk, only the first msgpack object is read so
+    the padding or stale bytes past the payload of reused chunk files are ignored.
+    """
+    import msgpack
+    unpacker = msgpack.Unpacker()
+    unpacker.feed(data)
+    return unpacker.unpack()
@@ -0,0 +1,245 @@
+import os
+import mmap
+import struct
+import hashlib
+
+
+def key_hash(key):
+    """
+    Return a stable, non zero 64 bit hash of `key`, the builtin hash() is
+    salted per process so it cannot be persisted across restarts.
+    """
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    elif not isinstance(key, bytes):
+        key = repr(key).encode('utf-8')
+    h = int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+    return h or 1
+
+
+class BloomFilter:
+    """
+    Fixed size Bloom filter over 64 bit key hashes, used for fast negative
+    checks before looking up the on disk key index. `bits` may be a writable
+    buffer of `size_bytes` to keep the filter in, e.g. a slice of an mmap.
+    """
+
+    def __init__(self, size_bytes, hashes=4, bits=None, count=0):
+        self.bits = bytearray(size_bytes) if bits is None else bits
+        self.size = size_bytes * 8
+        self.hashes = hashes
+        self.count = count
+
+    def _positions(self, h):
+        h1, h2 = h & 0xffffffff, (h >> 32) | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, h):
+        for pos in self._positions(h):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def clear(self):
+        self.bits[:] = bytes(len(self.bits))
+        self.count = 0
+
+    def __contains__(self, h):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(h))
+
+
+class KeyIndex:
+    """
+    Persistent index of the keys put in the last `window` puts.
+
+    Keys live in a fixed size open addressing table of (hash, seq) slots that
+    is mmap'ed from `file_name`, entries older than `window` are expired
+    implicitly & their slots reused, so the file never grows. Two rotating
+    Bloom filter generations of at most `bloom_bytes` each cover every key in
+    the window, they are mmap'ed from `file_name`.bloom so opening the index
+    does not read the table. It is only scanned, a slice at a time, when the
+    filters are missing or the window changed, memory use is therefore
+    bounded regardless of window size.
+
+    Keys of items still in the memory put buffer are kept pending & only
+    written to the table by commit() once their chunk reaches disk.
+    """
+
+    HEADER = struct.Struct('<QQ')
+    SLOT = struct.Struct('<QQ')
+    # bloom bytes, current generation (0 or 1), key count of each generation
+    BLOOM_HEADER = struct.Struct('<QQQQ')
+    MAX_PROBE = 32
+    MAX_BLOOM_BYTES = 1 << 20
+    # No. of slots read at a time when the table is scanned.
+    SCAN_SLOTS = 1 << 16
+
+    def __init__(self, file_name, window, bloom_bytes=None):
+
+        if window <= 0:
+            raise ValueError("'window' must be a positive integer")
+
+        self.file_name = file_name
+        self.window = window
+        self.slots = 1 << (2 * window - 1).bit_length()
+        self.bloom_bytes = bloom_bytes or min(self.MAX_BLOOM_BYTES, max(64, window * 2))
+        self.pending = set()
+
+        old_name = file_name + '.old'
+        if os.path.exists(file_name) and not os.path.exists(old_name):
+            with open(file_name, 'rb') as fp:
+                slots, self.seq = self.HEADER.unpack(fp.read(self.HEADER.size))
+            if slots != self.slots:
+                # Window changed since the table was written, its live keys
+                # are re-inserted into a table sized for the new window.
+                os.replace(file_name, old_name)
+
+        rebuild = not os.path.exists(file_name)
+        if rebuild:
+            # Also resumes a resize interrupted by a crash.
+            self.seq = 0
+            if os.path.exists(old_name):
+                with open(old_name, 'rb') as fp:
+                    self.seq = self.HEADER.unpack(fp.read(self.HEADER.size))[1]
+            with open(file_name, 'wb') as fp:
+                fp.write(self.HEADER.pack(self.slots, self.seq))
+                fp.truncate(self.HEADER.size + self.SLOT.size * self.slots)
+                fp.flush()
+                os.fsync(fp.fileno())
+            self._fp, self._mmap = self._open(file_name)
+            if os.path.exists(old_name):
+                for h, seq in self._scan(old_name):
+                    self._insert(h, seq)
+        else:
+            self._fp, self._mmap = self._open(file_name)
+
+        self._open_bloom(rebuild)
+        if rebuild:
+            self.flush()
+            if os.path.exists(old_name):
+                os.remove(old_name)
+
+    def _open(self, file_name):
+        fp = open(file_name, 'r+b')
+        return fp, mmap.mmap(fp.fileno(), 0)
+
+    def _scan(self, file_name):
+        """ Yield the live (hash, seq) slots of a table file, a slice at a time"""
+        with open(file_name, 'rb') as fp:
+            fp.seek(self.HEADER.size)
+            while True:
+                data = fp.read(self.SLOT.size * self.SCAN_SLOTS)
+                if not data:
+                    return
+                for h, seq in self.SLOT.iter_unpack(data):
+                    if h and seq > self.seq - self.window:
+                        yield h, seq
+
+    def _open_bloom(self, rebuild):
+        bloom_name = self.file_name + '.bloom'
+        size = self.BLOOM_HEADER.size + 2 * self.bloom_bytes
+        if not rebuild and os.path.exists(bloom_name):
+            with open(bloom_name, 'rb') as fp:
+                header = fp.read(self.BLOOM_HEADER.size)
+            rebuild = len(header) != self.BLOOM_HEADER.size or \
+                self.BLOOM_HEADER.unpack(header)[0] != self.bloom_bytes
+        else:
+            rebuild = True
+
+        if rebuild:
+            with open(bloom_name, 'wb') as fp:
+                fp.write(self.BLOOM_HEADER.pack(self.bloom_bytes, 0, 0, 0))
+                fp.truncate(size)
+        self._bloom_fp, self._bloom_mmap = self._open(bloom_name)
+
+        bloom_bytes, generation, *counts = self.BLOOM_HEADER.unpack_from(self._bloom_mmap)
+        view = memoryview(self._bloom_mmap)
+        filters = [BloomFilter(self.bloom_bytes, count=counts[i],
+                               bits=view[self.BLOOM_HEADER.size + i * self.bloom_bytes:
+                                         self.BLOOM_HEADER.size + (i + 1) * self.bloom_bytes])
+                   for i in range(2)]
+        self.current, self.previous = filters[generation], filters[1 - generation]
+        self._generation = generation
+
+        if rebuild:
+            # At most `window` keys are live, they all fit the current generation.
+            for h, seq in self._scan(self.file_name):
+                self.current.add(h)
+
+    def _bloom_add(self, h):
+        if self.current.count >= self.window:
+            self.current, self.previous = self.previous, self.current
+            self._generation = 1 - self._generation
+            self.current.clear()
+        self.current.add(h)
+
+    def _slot_offset(self, index):
+        return self.HEADER.size + self.SLOT.size * index
+
+    def _lookup(self, h):
+        mask = self.slots - 1
+        for i in range(self.MAX_PROBE):
+            slot_hash, seq = self.SLOT.unpack_from(self._mmap, self._slot_offset((h + i) & mask))
+            if slot_hash == 0:
+                return False
+            if slot_hash == h:
+                return seq > self.seq - self.window
+        return False
+
+    def _insert(self, h, seq):
+        mask = self.slots - 1
+        oldest, oldest_seq = None, None
+        for i in range(self.MAX_PROBE):
+            index = (h + i) & mask
+            slot_hash, slot_seq = self.SLOT.unpack_from(self._mmap, self._slot_offset(index))
+            if slot_hash in (0, h) or slot_seq <= seq - self.window:
+                break
+            if oldest is None or slot_seq < oldest_seq:
+                oldest, oldest_seq = index, slot_seq
+        else:
+            # The probe run is full of live keys, evict the oldest one.
+            index = oldest
+        self.SLOT.pack_into(self._mmap, self._slot_offset(index), h, seq)
+
+    def seen(self, h):
+        """ Return True if the key hash `h` was put within the window"""
+        if h in self.pending:
+            return True
+        if h not in self.current and h not in self.previous:
+            return False
+        return self._lookup(h)
+
+    def record(self, h):
+        """ Record the key hash `h` of an item put in the memory buffer"""
+        self.pending.add(h)
+
+    def commit(self, hashes=None):
+        """
+        Write the pending key hashes `hashes` (every pending key by default)
+        to the on disk table & flush it.
+        """
+        hashes = list(self.pending if hashes is None else hashes)
+        if not hashes:
+            return
+        for h in hashes:
+            self.pending.discard(h)
+            self.seq += 1
+            self._insert(h, self.seq)
+            self._bloom_add(h)
+        self.flush()
+
+    def flush(self):
+        # The filters are flushed first so that they always cover every key
+        # of the table on disk.
+        counts = [0, 0]
+        counts[self._generation], counts[1 - self._generation] = self.current.count, self.previous.count
+        self.BLOOM_HEADER.pack_into(self._bloom_mmap, 0, self.bloom_bytes, self._generation, *counts)
+        self._bloom_mmap.flush()
+        self.HEADER.pack_into(self._mmap, 0, self.slots, self.seq)
+        self._mmap.flush()
+
+    def close(self):
+        self.current = self.previous = None
+        self._bloom_mmap.close()
+        self._bloom_fp.close()
+        self._mmap.close()
+        self._fp.close()
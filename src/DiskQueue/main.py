@@ -1,29 +1,52 @@
-import os, sys
-import marshal
-import random 
-import msgpack
+import os
+from time import time
 
-
-from threading import Lock
 import threading
 
 from .exceptions import Full, Empty
+from . import chunk_io
 class DiskQueue:
 
-    def __init__(self, path, queue_name, cache_size, memory_safe=False, max_size=None):
+    def __init__(self, path, queue_name, cache_size, memory_safe=False, max_size=None,
+                 io_mode=chunk_io.BUFFERED, dedup_window=None, chunk_cache=None,
+                 record_format=None, wal=False):
+
+        if io_mode not in chunk_io.IO_MODES:
+            raise ValueError(f"'io_mode' must be one of {', '.join(chunk_io.IO_MODES)}")
+        if wal and chunk_cache is not None:
+            # Chunks held by the cache are not on disk, the log could not be
+            # truncated once the put buffer is handed to it.
+            raise ValueError("'wal' cannot be combined with a 'chunk_cache'")
 
         self.queue_name = queue_name
         self.cache_size = cache_size
 
         self.queue_dir = os.path.join(path, self.queue_name) 
         self.index_file = os.path.join(self.queue_dir,'000')
+
+        # Fixed size records (a struct format or NumPy dtype) are kept packed
+        # in bytearray buffers & stored as contiguous arrays in chunk files.
+        self.record_format = record_format
+        self._records = None
+        if record_format is not None:
+            from .records import make_records
+            self._records = make_records(record_format)
         
-        self.get_memory_buffer = []
-        self.put_memory_buffer = []
+        self.get_memory_buffer = self._new_buffer()
+        self.put_memory_buffer = self._new_buffer()
 
         self.max_size = max_size
+        self.io_mode = io_mode
+        self.dedup_window = dedup_window
+        self.chunk_cache = chunk_cache
+        self.wal = wal
+
+        # Exact no. of items in the queue, maintained incrementally by
+        # `_put` / `_get` so size reads never need to take the queue lock.
+        self._size = 0
+        # No. of items in chunks held by `chunk_cache` that are not on disk.
+        self._cached_items = 0
 
-        self._thread_lock = threading.Lock()
         self.mutex = threading.Lock()
         self.not_empty = threading.Condition(self.mutex)
         self.not_full  = threading.Condition(self.mutex)
@@ -31,46 +54,105 @@ class DiskQueue:
         self.all_tasks_done = threading.Condition(self.mutex)
         self.unfinished_tasks = 0
 
+        # Callbacks run after every put() with `self.mutex` held, used by
+        # QueueSelector to wait on many queues at once.
+        self._listeners = []
+
+        # Write ahead log of the memory buffers, opened once the queue is recovered.
+        self._wal = None
+        # While `wal` is on the chunk file loaded into the get buffer is kept
+        # until the next one is loaded, & the log records how many of the get
+        # buffer's items were handed out.
+        self._wal_chunk = None
+        self._head_consumed = 0
+
+        # Keys of the last `dedup_window` puts, stored alongside the index file,
+        # opened on the first put() with a key.
+        self._key_index = None
+        # Hashes of the keys of items not on disk yet, they are committed to
+        # `_key_index` per chunk once it is written, or once the items of a
+        # get buffer that never reached disk were all handed out.
+        self._put_keys = []
+        self._get_keys = []
+        self._cached_keys = {}
+
+        if self.chunk_cache is not None:
+            self.chunk_cache.register(self)
 
         self._init_queue()
 
+        # Consumed chunk files kept for reuse by the preallocated & direct
+        # modes, named spare0, spare1, ...
+        self._spare_chunks = []
+        if io_mode != chunk_io.BUFFERED:
+            while len(self._spare_chunks) < chunk_io.SPARE_CHUNKS:
+                spare = os.path.join(self.queue_dir, f'spare{len(self._spare_chunks)}')
+                if not os.path.exists(spare):
+                    break
+                self._spare_chunks.append(spare)
+
+        # Items logged before a crash are replayed into the memory buffers.
+        if wal:
+            from .wal import WriteAheadLog
+            self._wal = WriteAheadLog(os.path.join(self.queue_dir, 'wal'), self.io_mode)
+            chunk, get_items, put_items = self._wal.replay(self.head, self.tail)
+            self._restore_get_buffer(chunk)
+            # The get buffer's items are in the log, their keys are committed
+            # right away like on a hand over, see _fill_get_buffer().
+            self._commit_keys(self._replay_items(self.get_memory_buffer, get_items))
+            self._put_keys = self._replay_items(self.put_memory_buffer, put_items)
+
+        # Items recovered from disk are still to be processed.
+        self.unfinished_tasks = self._size
+
 
     def _init_queue(self):
 
-        """ If thus Queue was being operated upon previously , recover checkpoints """
+        """
+        If thus Queue was being operated upon previously , recover checkpoints.
+        Only the index file is read here, the head chunk is loaded by the first get() / peek().
+        """
 
         if os.path.exists(self.queue_dir):
             with open(self.index_file) as f:
-                self.head , self.tail = [int(x) for x in f.read().split(',')]
+                header = [int(x) for x in f.read().split(',')]
 
-            self._sync_from_fs_to_memory_buffer()
-            # TODO: this bug was not captured in the tests.
-            self.head += 1
-            self._sync_index_pointers(self.head, self.tail)
+            self.head, self.tail = header[:2]
+            if len(header) > 2:
+                self._size = header[2]
+            else:
+                # Index files written by older versions do not carry the item
+                # count, so count the items present in the chunk files once.
+                self._size = self._count_disk_items()
 
         else:
             self.head, self.tail = 0,0
             os.mkdir(self.queue_dir)
             with open(self.index_file, 'w') as f:
-                f.write(f"{self.head},{self.tail}")
+                f.write(f"{self.head},{self.tail},{self._size}")
                 f.flush()
-                os.fsync(f.fileno())
+                chunk_io.sync_fd(f.fileno(), self.io_mode)
 
         """ Initialize get & put memory buffers   """
         
 
     def _sync_index_pointers(self, head, tail):
         """
-        Sync the index of  head & tail pointers
+        Sync the index of  head & tail pointers along with the no. of items
+        persisted in the chunk files between them.
         """
 
+        disk_size = self._size - len(self.get_memory_buffer) - len(self.put_memory_buffer) \
+                - self._cached_items
+
         with open(self.index_file, 'r+') as f:
             f.read()
             f.seek(0)
-            f.write(f"{head},{tail}")
+            f.write(f"{head},{tail},{disk_size}")
+            f.truncate()
 
             f.flush()
-            os.fsync(f.fileno())
+            chunk_io.sync_fd(f.fileno(), self.io_mode)
 
     def sync(self):
         """
@@ -94,15 +176,28 @@ class DiskQueue:
         '''
 
 
-        with self._thread_lock:
-            self._sync_memory_buffer_to_fs('put_buffer')
-            self._sync_memory_buffer_to_fs('get_buffer')
-            self.put_memory_buffer = []
-            self.get_memory_buffer = []
-            self.tail += 1
-            if self.head > 0:
+        with self.mutex:
+            if self.chunk_cache is not None:
+                self.chunk_cache.flush(self)
+            # Only non empty buffers are written, an empty chunk on disk would
+            # otherwise be counted as a slot holding items.
+            if self.put_memory_buffer:
+                self._sync_memory_buffer_to_fs('put_buffer')
+                self.put_memory_buffer = self._new_buffer()
+                self.tail += 1
+                keys, self._put_keys = self._put_keys, []
+            else:
+                keys = []
+            if self.get_memory_buffer and self._wal is None:
+                # The get buffer always precedes the head chunk, so it is
+                # written one slot before it (which may be a negative index).
+                # With `wal` it is already on disk, in the chunk file the log's
+                # cursor points to.
                 self.head -= 1
-            self._sync_index_pointers(self.head, self.tail)
+                self._sync_memory_buffer_to_fs('get_buffer')
+                self.get_memory_buffer = self._new_buffer()
+                keys, self._get_keys = keys + self._get_keys, []
+            self._sync_flushed(keys)
 
     
 
@@ -112,75 +207,333 @@ class DiskQueue:
         """
         if buffer_type == 'put_buffer':
             mem_buffer = self.put_memory_buffer
-            file_name  = os.path.join(self.queue_dir, str(self.tail))
+            index = self.tail
         else:
-            file_name  = os.path.join(self.queue_dir, str(self.head-1))
+            index = self.head
             mem_buffer = self.get_memory_buffer
 
-        with open(file_name, 'wb+') as fp:
-            fp.write(msgpack.packb(mem_buffer))
-            fp.flush()
-            os.fsync(fp.fileno())
+        self._write_chunk(index, self._pack_chunk(mem_buffer))
+
+
+    def _write_chunk(self, index, payload):
+        file_name = os.path.join(self.queue_dir, str(index))
+        if self._spare_chunks:
+            # Overwrite a consumed chunk file in place, its blocks are already
+            # allocated.
+            os.replace(self._spare_chunks.pop(), file_name)
+        chunk_io.write_chunk(file_name, payload, self.io_mode)
+
+
+    def _remove_chunk(self, index):
+        file_name = os.path.join(self.queue_dir, str(index))
+        try:
+            if self.io_mode != chunk_io.BUFFERED and len(self._spare_chunks) < chunk_io.SPARE_CHUNKS:
+                spare = os.path.join(self.queue_dir, f'spare{len(self._spare_chunks)}')
+                os.replace(file_name, spare)
+                self._spare_chunks.append(spare)
+            else:
+                os.remove(file_name)
+        except FileNotFoundError:
+            # Chunk lost from memory in a crash, or already removed.
+            pass
+
+
+    def _flush_wal(self):
+        """
+        Drop the put buffer's items from the write ahead log once they were
+        flushed to a chunk the index file points to.
+        """
+        if self._wal is not None:
+            self._wal.flush(self.tail)
+
+
+    def _log_consumed(self):
+        # Called after get() / get_many() with `self.mutex` held.
+        if self._wal is not None:
+            self._wal.consume(self._head_consumed)
+
+
+    def _replay_items(self, mem_buffer, items):
+        keys = []
+        for payload, h in items:
+            mem_buffer.append(self._unpack_item(payload))
+            self._size += 1
+            # Keys of replayed items are pending again, so a retried put is still skipped.
+            if h and self.dedup_window:
+                self._open_key_index().record(h)
+                keys.append(h)
+        return keys
+
+
+    def _restore_get_buffer(self, chunk):
+        """
+        Reload the items not yet handed out from the chunk that was in the get
+        buffer at crash time, as named by the write ahead log's cursor.
+        """
+        # A crash between moving the head & removing the previous chunk file
+        # leaves it behind.
+        for index in (self.head - 2, self.head - 1):
+            if chunk is None or index != chunk[0]:
+                self._remove_chunk(index)
+
+        if chunk is None:
+            return
+        index, consumed = chunk
+        file_name = os.path.join(self.queue_dir, str(index))
+        if not os.path.exists(file_name):
+            return
+
+        with open(file_name, 'rb') as fp:
+            mem_buffer = self._unpack_chunk(fp.read())
+        if self._records is None:
+            del mem_buffer[:consumed]
+        else:
+            mem_buffer.take(consumed)
+
+        self.get_memory_buffer = mem_buffer
+        self._size += len(mem_buffer)
+        self._wal_chunk = index
+        self._head_consumed = consumed
+
+
+    def _new_buffer(self):
+        if self._records is None:
+            return []
+        from .records import RecordBuffer
+        return RecordBuffer(self._records)
+
+
+    def _pack_chunk(self, mem_buffer):
+        if self._records is None:
+            return chunk_io.pack_chunk(mem_buffer)
+        return mem_buffer.pack_chunk()
+
+
+    def _as_list(self, batch):
+        if self._records is None:
+            return list(batch)
+        return self._records.as_list(batch)
+
+
+    def _pack_item(self, obj):
+        if self._records is None:
+            return chunk_io.pack_chunk(obj)
+        return self._records.pack(obj)
+
+
+    def _unpack_item(self, data):
+        if self._records is None:
+            return chunk_io.unpack_chunk(data)
+        return self._records.unpack_from(data, 0)
+
+
+    def _unpack_chunk(self, data):
+        if self._records is None:
+            return chunk_io.unpack_chunk(data)
+        from .records import RecordBuffer
+        return RecordBuffer.unpack_chunk(self._records, data)
+
+
+    def _spill_chunk(self, index, payload, count):
+        """
+        Write a chunk evicted from `chunk_cache` to disk, called by the cache
+        with `self.mutex` held.
+        """
+        self._spill_chunks([(index, payload, count)])
+
+
+    def _spill_chunks(self, chunks):
+        """
+        Write a run of (index, payload, count) chunks evicted from
+        `chunk_cache` back to back & sync the index once for all of them.
+        """
+        for index, payload, count in chunks:
+            self._write_chunk(index, payload)
+            self._cached_items -= count
+        self._sync_index_pointers(self.head, self.tail)
+        for index, payload, count in chunks:
+            self._commit_keys(self._cached_keys.pop(index, []))
 
 
 
     def _sync_from_fs_to_memory_buffer(self, readonly=False):
         """
-        Sync data from fs to memory cache, when read only is False(default) the file is
-        deleted after loading it into memory , otherwise do not delete the file(used for peek()).
+        Sync data from fs to memory cache, when read only is False(default) the chunk is
+        removed from `chunk_cache`, otherwise it is left there (used for peek()).
+        Returns True if the chunk was read from disk, False if it came from `chunk_cache`
+        or does not exist. Chunk files are deleted by _load_head_chunk().
         """
+
+        if self.chunk_cache is not None:
+            if readonly:
+                entry = self.chunk_cache.get(self, self.head)
+            else:
+                entry = self.chunk_cache.pop(self, self.head)
+            if entry is not None:
+                payload, count = entry
+                self.get_memory_buffer = self._unpack_chunk(payload)
+                if not readonly:
+                    self._cached_items -= count
+                    self._get_keys = self._cached_keys.pop(self.head, [])
+                return False
        
         file_name  = os.path.join(self.queue_dir, str(self.head))
         
         if os.path.exists(file_name):
             with open(file_name, 'rb') as fp:
                 data = fp.read()
-                data = msgpack.unpackb(data)
+                data = self._unpack_chunk(data)
                 self.get_memory_buffer = data
-                if not readonly:
-                    try:
-                        os.remove(file_name)
-                    except Exception as e:
-                        print(e)
-                        print("error removing queue file {file_name} from disk")
+            return True
+        return False
+
+
+    def _load_head_chunk(self):
+        """
+        Load chunks from the head pointer into the get buffer, chunks that
+        were lost (held in memory by `chunk_cache` at crash time) are skipped.
+        """
+        loaded = []
+        while not self.get_memory_buffer and self.head != self.tail:
+            if self._sync_from_fs_to_memory_buffer():
+                loaded.append(self.head)
+            self.head += 1
+
+        # The head pointer only needs persisting once a chunk file was consumed,
+        # & the file is only deleted after that so a crash in between can never
+        # leave the index counting a chunk that no longer exists.
+        if loaded:
+            if self._wal is not None:
+                # The chunk now in the get buffer is kept until the next one is
+                # loaded, the log must point to it before the index moves past it.
+                if self._wal_chunk is not None:
+                    loaded.insert(0, self._wal_chunk)
+                self._wal_chunk = loaded.pop()
+                self._head_consumed = 0
+                self._wal.load_chunk(self._wal_chunk)
+            self._sync_index_pointers(self.head, self.tail)
+        for index in loaded:
+            self._remove_chunk(index)
+
+    def _count_disk_items(self):
+        """ Count the items stored in chunk files between head & tail pointers"""
+        count = 0
+        for index in range(self.head, self.tail):
+            try:
+                count += len(self._read_file(index))
+            except KeyError:
+                pass
+        return count
+
+    def qsize(self):
+        """
+        Return the exact no. of items in the queue, this does not take the
+        queue lock so monitoring threads never contend with put() / get().
+        """
+        return self._size
+
+    def empty(self):
+        """ Return True if the queue is empty, False otherwise"""
+        return self._size == 0
+
+    def full(self):
+        """ Return True if the queue has `max_size` items, False otherwise"""
+        return bool(self.max_size) and self._size >= self.max_size
 
     def __len__(self):
         """ Return the length of the queue"""
-        with self._thread_lock:
-            return (self.tail - self.head)  * self.cache_size + (len(self.get_memory_buffer) \
-                    + len(self.put_memory_buffer))
+        return self._size
 
     def close(self):
-        pass
+        if self.chunk_cache is not None:
+            with self.mutex:
+                self.chunk_cache.unregister(self)
+        if self._key_index:
+            self._key_index.close()
+        if self._wal is not None:
+            self._wal.close()
 
 
-    def _get(self):
+    def _fill_get_buffer(self):
+        """ Load the next chunk (or the put buffer) into an empty get buffer"""
 
-        # Check if anything is present in the `get` memory buffer
         if self.get_memory_buffer:
-            return self.get_memory_buffer.pop(0)
+            return
+        # Every item of the previous get buffer was handed out.
+        self._commit_keys(self._get_keys)
+        self._get_keys = []
+
+        if self.head != self.tail:
+            self._load_head_chunk()
+
+        # Check head & tail pointers are same
+        if not self.get_memory_buffer and self.head == self.tail:
+            self.get_memory_buffer = self.put_memory_buffer
+            self.put_memory_buffer = self._new_buffer()
+            self._get_keys, self._put_keys = self._put_keys, []
+            if self._wal is not None and self.get_memory_buffer:
+                # The items stay in the log, which now counts the ones handed
+                # out of them instead of the previous chunk's. Their keys are
+                # committed now since a replay drops the consumed ones.
+                self._head_consumed = 0
+                self._wal.handoff()
+                self._commit_keys(self._get_keys)
+                self._get_keys = []
+                if self._wal_chunk is not None:
+                    self._remove_chunk(self._wal_chunk)
+                    self._wal_chunk = None
+
+            if not self.get_memory_buffer:
+                # Every slot is drained, an index written before a crash may
+                # still count items that were lost with it.
+                self._size = 0
 
-        else:
-            # Check head & tail pointers are same
-            if self.head == self.tail:
-                self.get_memory_buffer = self.put_memory_buffer
-                self.put_memory_buffer = []
 
-            else:
-                self._sync_from_fs_to_memory_buffer()
-                self.head += 1 
-                self._sync_index_pointers(self.head, self.tail)
+    def _get(self):
+
+        self._fill_get_buffer()
     
         try: 
-            obj = self.get_memory_buffer[0]
+            obj = self.get_memory_buffer.pop(0)
         except IndexError:
             obj = None
         else:
-            del self.get_memory_buffer[0]
+            self._size -= 1
+            self._head_consumed += 1
         
         return obj
 
 
+    def _get_many(self, count):
+
+        # With `wal` a batch never spans two get buffers, the log only counts
+        # the items handed out of the current one so a crash before returning
+        # would lose the rest of the batch.
+        if self._records is None:
+            objects = []
+            while len(objects) < count:
+                if self._wal is not None and objects and not self.get_memory_buffer:
+                    break
+                objects.append(self._get())
+            return objects
+
+        # Typed records are sliced out of the get buffer a chunk at a time,
+        # without creating an object per record.
+        batches = []
+        while count:
+            if self._wal is not None and batches and not self.get_memory_buffer:
+                break
+            self._fill_get_buffer()
+            if not self.get_memory_buffer:
+                break
+            batch = self.get_memory_buffer.take(count)
+            count -= len(batch)
+            self._size -= len(batch)
+            self._head_consumed += len(batch)
+            batches.append(batch)
+        return self._records.join(batches)
+
+
     def get(self, block=True , timeout=None):
         
         """
@@ -191,22 +544,9 @@ class DiskQueue:
         """
 
         with self.not_empty:
-            if not block:
-                if self._qsize() == 0:
-                    raise Empty
-            elif timeout is None:
-                while not self._qsize():
-                    self.not_empty.wait()
-            elif timeout < 0:
-                raise ValueError("'timeout' must be a non-negative number")
-            else:
-                endtime = time() + timeout
-                while not self._qsize():
-                    time_left = endtime - time()
-                    if time_left < 0.0:
-                        raise Empty
-                    self.not_empty.wait(time_left)
+            self._wait_not_empty(block, timeout)
             obj = self._get()
+            self._log_consumed()
 
             # Notify all consumer threads that a slot is empty 
             self.not_full.notify()
@@ -214,21 +554,120 @@ class DiskQueue:
             return obj
 
 
+    def get_many(self, max_items, block=True, timeout=None):
+        """
+        Gets up to `max_items` objects from the queue in a single call, blocking
+        & raising Empty the same way get() does until at least one object is
+        available. Does not wait for more objects once one is available.
+        Queues with a NumPy `record_format` return the objects as an array.
+        With `wal` at most the rest of the chunk being consumed is returned.
+        """
+
+        if max_items <= 0:
+            raise ValueError("'max_items' must be a positive integer")
+
+        with self.not_empty:
+            self._wait_not_empty(block, timeout)
+            objects = self._get_many(min(max_items, self._qsize()))
+            self._log_consumed()
+
+            self.not_full.notify(len(objects))
+
+            return objects
+
+
+    def _wait_not_empty(self, block, timeout):
+        # Must be called with `self.mutex` held.
+        if not block:
+            if self._qsize() == 0:
+                raise Empty
+        elif timeout is None:
+            while not self._qsize():
+                self.not_empty.wait()
+        elif timeout < 0:
+            raise ValueError("'timeout' must be a non-negative number")
+        else:
+            endtime = time() + timeout
+            while not self._qsize():
+                time_left = endtime - time()
+                if time_left < 0.0:
+                    raise Empty
+                self.not_empty.wait(time_left)
+
+
     def _qsize(self):
-        return self.__len__()
+        return self._size
 
 
     def _put(self, obj):
 
         if len(self.put_memory_buffer) >= self.cache_size:
-            self._sync_memory_buffer_to_fs('put_buffer')
-            self.put_memory_buffer = []
-            self.tail += 1
-            self._sync_index_pointers(self.head, self.tail)
+            if self.chunk_cache is not None:
+                # The chunk stays in memory until the shared cache runs out of
+                # budget, pointers are moved first as storing may spill it.
+                index, count = self.tail, len(self.put_memory_buffer)
+                payload = self._pack_chunk(self.put_memory_buffer)
+                self.put_memory_buffer = self._new_buffer()
+                self.tail += 1
+                self._cached_items += count
+                # The keys are only committed once the chunk is spilled to disk.
+                if self._put_keys:
+                    self._cached_keys[index] = self._put_keys
+                    self._put_keys = []
+                self.chunk_cache.store(self, index, payload, count)
+            else:
+                self._flush_put_buffer()
         self.put_memory_buffer.append(obj)
+        self._size += 1
+
+
+    def _flush_put_buffer(self):
+        self._sync_memory_buffer_to_fs('put_buffer')
+        self.put_memory_buffer = self._new_buffer()
+        self.tail += 1
+        keys, self._put_keys = self._put_keys, []
+        self._sync_flushed(keys)
+
+
+    def _sync_flushed(self, keys):
+        """ Persist the index pointers after chunks were written & commit the `keys` of their items"""
+        if self._wal is not None:
+            # The log still holds the items, if the index does not count
+            # their chunk yet they are replayed along with their keys.
+            self._commit_keys(keys)
+        self._sync_index_pointers(self.head, self.tail)
+        if self._wal is None:
+            # Items of a chunk the index does not count are lost, their keys
+            # must stay free to be put again.
+            self._commit_keys(keys)
+        self._flush_wal()
+
+
+    def _commit_keys(self, hashes):
+        # Keys are only persisted once the chunk holding their items is on
+        # disk, so an item lost from the memory buffer can be put again.
+        if self._key_index and hashes:
+            self._key_index.commit(hashes)
+
 
+    def _key_hash(self, key):
+        if key is None:
+            return None
+        if not self.dedup_window:
+            raise ValueError("put() with a 'key' requires the queue to have a 'dedup_window'")
+        from .dedup import key_hash
+        self._open_key_index()
+        return key_hash(key)
 
-    def put(self, obj, block=True, timeout=None):
+
+    def _open_key_index(self):
+        if self._key_index is None:
+            from .dedup import KeyIndex
+            self._key_index = KeyIndex(os.path.join(self.queue_dir, 'keys'), self.dedup_window)
+        return self._key_index
+
+
+    def put(self, obj, block=True, timeout=None, key=None):
         """
         Puts an obj into the queue, if block is True & timeout is None (default),
         block if necessary until the next slot is available, if timeout is a non-negative 
@@ -236,9 +675,20 @@ class DiskQueue:
         free slot was available within that time, otherwise ('block' is false), put an item
         on the queue if a free slot is immediately available, else raise the full exception,
         ('timeout' is ignored in this case
+
+        When a `key` is given on a queue created with a `dedup_window`, the obj is
+        skipped if an item with the same key was put within the last `dedup_window`
+        puts. Returns False if the obj was skipped as a duplicate, True otherwise.
+
+        On a queue created with `wal=True` put() returns once the obj is logged
+        to disk, concurrent puts share a single sync of the log.
         """
-        
+
+        seq = None
         with self.not_full:
+            h = self._key_hash(key)
+            if h and self._key_index.seen(h):
+                return False
             if self.max_size:
                 if not block:
                     if self._qsize() >= self.max_size:
@@ -249,15 +699,41 @@ class DiskQueue:
                 elif timeout < 0:
                     raise ValueError('timeout must be a non negative number')
                 else:
-                    endtime = time() + self.timeout
+                    endtime = time() + timeout
                     while self._qsize() >= self.max_size:
                         time_left = endtime - time()
-                        if remaining <= 0.0:
+                        if time_left <= 0.0:
                             raise Full
+                        self.not_full.wait(time_left)
+                # Another producer may have put the same key while waiting.
+                if h and self._key_index.seen(h):
+                    return False
             self._put(obj)
+            if self._wal is not None:
+                seq = self._wal.append(self._pack_item(obj), h)
+            if h:
+                self._key_index.record(h)
+                self._put_keys.append(h)
             self.unfinished_tasks += 1
             # notify other threads waiting on `not_empty` condition variable
             self.not_empty.notify()
+            for listener in self._listeners:
+                listener()
+
+        # Group commit, the log is synced without holding the queue lock.
+        if seq is not None:
+            self._wal.wait_durable(seq)
+        return True
+
+
+    def _add_listener(self, listener):
+        with self.mutex:
+            self._listeners = self._listeners + [listener]
+
+
+    def _remove_listener(self, listener):
+        with self.mutex:
+            self._listeners = [l for l in self._listeners if l != listener]
 
 
 
@@ -280,7 +756,7 @@ class DiskQueue:
               if unfinished < 0:
                   raise ValueError('task_done() called too many times')
               self.all_tasks_done.notify_all()
-           self.unfinished_task = unfinished
+           self.unfinished_tasks = unfinished
 
 
 
@@ -294,19 +770,24 @@ class DiskQueue:
         When the  count of unfinished  tasks drops to zero, join unblocks.
         '''
 
-        with self.all_task_done:
+        with self.all_tasks_done:
             while self.unfinished_tasks:
                 self.all_tasks_done.wait()
 
       
     def _read_file(self, index):
-        '''Read a file with given `index` from disk'''
-        
+        '''Read a file with given `index` from disk (or from `chunk_cache` if it holds it)'''
+
+        if self.chunk_cache is not None:
+            entry = self.chunk_cache.get(self, index)
+            if entry is not None:
+                return self._unpack_chunk(entry[0])
+
         file_name = os.path.join(self.queue_dir, str(index))
         if os.path.exists(file_name):
             with open(file_name, 'rb') as fp:
                 data = fp.read()
-                data = msgpack.unpackb(data)
+                data = self._unpack_chunk(data)
                 return data 
         else:
             raise KeyError('yo')
@@ -316,27 +797,32 @@ class DiskQueue:
         '''Return the top items of queue without popping it, 
            the default no of items is 1 , otherwise  return `count` no of items.
            Non blocking by default.Multiple threads doinf a peek() will return the same value
+           Returns fewer than `count` items if the queue holds less, raises Empty if it holds none.
         '''
 
         if count <= 0:
             raise ValueError('Argument to peek() must be a positive integer')
-        else:
-            c = 1
-            get_buffer_index = 0
-            file_index = 0
-            objects = []
-            data = self.get_memory_buffer
-
-            while c <= count:
-                if data  and (get_buffer_index < self.cache_size) :
-                        obj = data[get_buffer_index]
-                        objects.append(obj)
-                        c += 1
-                        get_buffer_index += 1
-                else:
-                    data = self._read_file(file_index)
-                    file_index += 1
-                    get_buffer_index = 0
+
+        with self.mutex:
+            if not self._qsize():
+                raise Empty
+
+            # Chunk loading is deferred until the first get() / peek().
+            if not self.get_memory_buffer:
+                self._load_head_chunk()
+
+            objects = self._as_list(self.get_memory_buffer[:count])
+            file_index = self.head
+
+            while len(objects) < count and file_index < self.tail:
+                try:
+                    objects.extend(self._as_list(self._read_file(file_index)[:count - len(objects)]))
+                except KeyError:
+                    # Chunk lost from memory in a crash.
+                    pass
+                file_index += 1
+
+            objects.extend(self._as_list(self.put_memory_buffer[:count - len(objects)]))
 
             if len(objects) == 1 : 
                 return objects[0]
@@ -344,12 +830,12 @@ class DiskQueue:
                 return objects            
  
             
-    def put_nowait(self, item):
+    def put_nowait(self, item, key=None):
         '''Put an item into the queue without blocking.
         Only enqueue the item if a free slot is immediately available.
         Otherwise raise the Full exception.
         '''
-        return self.put(item, block=False)
+        return self.put(item, block=False, key=key)
 
     def get_nowait(self):
         '''Remove and return an item from the queue without blocking.
@@ -0,0 +1,188 @@
+import threading
+from time import time
+
+from .exceptions import Empty
+from .chunk_io import pack_chunk, unpack_chunk
+
+
+PROCESS = 'process'
+THREAD = 'thread'
+
+
+def _run_packed_batch(func, payload):
+    """ Runs in the worker process, unpacks a batch & applies `func` to each item"""
+    for obj in unpack_chunk(payload):
+        func(obj)
+
+
+def _run_batch(func, objects):
+    for obj in objects:
+        func(obj)
+
+
+class WorkerPool:
+    """
+    Consume a DiskQueue with a pool of worker processes (or threads).
+
+    A dispatcher thread takes batches of up to `batch_size` items with
+    get_many() & submits them to the executor, batches of objects are
+    re-encoded with msgpack for process workers instead of being pickled item
+    by item. At most `max_in_flight` batches are submitted at a time, the
+    dispatcher stops taking items off the queue until a batch completes.
+    task_done() is called for every item of a batch once it completes, whether
+    `func` raised or not.
+
+    If the executor breaks (e.g. a worker process died) the batches it could
+    not run are acked & counted as failed, the dispatcher stops & join()
+    raises the error.
+
+    `func` is called with a single item & must be picklable (a module level
+    function) when `executor` is 'process'.
+    """
+
+    def __init__(self, queue, func, workers=4, batch_size=100, max_in_flight=None,
+                 executor=PROCESS, poll_interval=0.1):
+
+        if executor not in (PROCESS, THREAD):
+            raise ValueError(f"'executor' must be one of {PROCESS}, {THREAD}")
+
+        self.queue = queue
+        self.func = func
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight or workers * 2
+        self.executor = executor
+        self.poll_interval = poll_interval
+
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._stopping = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._pool = None
+        self._dispatcher = None
+
+        self.items = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.in_flight = 0
+        self.started_at = None
+        self.error = None
+
+    def start(self):
+        """ Start the executor & the dispatcher thread"""
+        # concurrent.futures pulls in multiprocessing & logging, only pay for
+        # it once a pool is actually started.
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+        if self.executor == PROCESS:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers)
+
+        self.started_at = time()
+        self.error = None
+        self._stopping.clear()
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+        return self
+
+    def stop(self, wait=True):
+        """
+        Stop taking items off the queue, if wait is True block until the
+        batches in flight are processed.
+        """
+        self._stopping.set()
+        if self._dispatcher:
+            self._dispatcher.join()
+        if self._pool:
+            self._pool.shutdown(wait=wait)
+
+    def join(self):
+        """
+        Block until every item put into the queue has been processed, raises
+        the error that stopped the pool if it broke.
+        """
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks and self.error is None:
+                self.queue.all_tasks_done.wait(self.poll_interval)
+        if self.error is not None:
+            raise self.error
+
+    def _dispatch(self):
+        while not self._stopping.is_set():
+            # Back pressure, wait for a free in flight slot before taking
+            # more items off the queue.
+            if not self._slots.acquire(timeout=self.poll_interval):
+                continue
+            try:
+                objects = self.queue.get_many(self.batch_size, timeout=self.poll_interval)
+            except Empty:
+                self._slots.release()
+                continue
+            except BaseException as e:
+                self._slots.release()
+                self._fail(e)
+                return
+
+            with self._stats_lock:
+                self.in_flight += 1
+
+            try:
+                # Typed queues already hand out packed arrays, only lists of
+                # objects are packed for process workers.
+                if self.executor == PROCESS and isinstance(objects, list):
+                    future = self._pool.submit(_run_packed_batch, self.func, pack_chunk(objects))
+                else:
+                    future = self._pool.submit(_run_batch, self.func, objects)
+            except BaseException as e:
+                # The executor is broken or shut down, the batch can't run.
+                self._ack_batch(len(objects), failed=True)
+                self._fail(e)
+                return
+            future.add_done_callback(lambda f, count=len(objects): self._batch_done(f, count))
+
+    def _fail(self, error):
+        if self.error is None:
+            self.error = error
+        self._stopping.set()
+        # Wake up join() right away.
+        with self.queue.all_tasks_done:
+            self.queue.all_tasks_done.notify_all()
+
+    def _ack_batch(self, count, failed):
+        with self._stats_lock:
+            self.in_flight -= 1
+            self.batches += 1
+            self.items += count
+            if failed:
+                self.failed_batches += 1
+
+        for i in range(count):
+            self.queue.task_done()
+        self._slots.release()
+
+    def _batch_done(self, future, count):
+        from concurrent.futures import BrokenExecutor
+
+        error = future.exception()
+        self._ack_batch(count, failed=error is not None)
+        if isinstance(error, BrokenExecutor):
+            self._fail(error)
+
+    def stats(self):
+        """ Return a dict of throughput stats since the pool was started"""
+        with self._stats_lock:
+            elapsed = time() - self.started_at if self.started_at else 0.0
+            return {
+                'items': self.items,
+                'batches': self.batches,
+                'failed_batches': self.failed_batches,
+                'in_flight': self.in_flight,
+                'elapsed': elapsed,
+                'items_per_sec': self.items / elapsed if elapsed else 0.0,
+            }
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
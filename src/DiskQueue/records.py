@@ -0,0 +1,133 @@
+import struct
+
+
+# Typed chunks start with a magic, the record size & the no. of payload
+# bytes, the payload length is needed since aligned chunk files are padded &
+# reused chunk files hold stale bytes past it.
+CHUNK_HEADER = struct.Struct('<4sIQ')
+CHUNK_MAGIC = b'DQR1'
+
+
+class StructRecords:
+    """ Records declared with a `struct` format string, returned as tuples"""
+
+    def __init__(self, fmt):
+        self.struct = struct.Struct(fmt)
+        self.itemsize = self.struct.size
+
+    def pack(self, obj):
+        return self.struct.pack(*obj)
+
+    def unpack_from(self, data, offset):
+        return self.struct.unpack_from(data, offset)
+
+    def batch(self, data, offset, count):
+        return list(self.struct.iter_unpack(memoryview(data)[offset:offset + count * self.itemsize]))
+
+    def join(self, batches):
+        return [obj for batch in batches for obj in batch]
+
+    def as_list(self, batch):
+        return list(batch)
+
+
+class NumpyRecords:
+    """
+    Records declared with a NumPy dtype, get() returns `.item()` of a record
+    & batches are returned as arrays, built with a single copy of the packed
+    chunk bytes. as_list() converts a batch to a list of `.item()` records.
+    """
+
+    def __init__(self, dtype):
+        import numpy
+        self.numpy = numpy
+        self.dtype = numpy.dtype(dtype)
+        self.itemsize = self.dtype.itemsize
+
+    def pack(self, obj):
+        return self.numpy.array(obj, dtype=self.dtype).tobytes()
+
+    def unpack_from(self, data, offset):
+        return self.numpy.frombuffer(data, self.dtype, 1, offset)[0].item()
+
+    def batch(self, data, offset, count):
+        # Copied so the array does not pin the buffer it was sliced from.
+        return self.numpy.frombuffer(data, self.dtype, count, offset).copy()
+
+    def join(self, batches):
+        if len(batches) == 1:
+            return batches[0]
+        return self.numpy.concatenate(batches) if batches else self.numpy.empty(0, self.dtype)
+
+    def as_list(self, batch):
+        return batch.tolist()
+
+
+def make_records(record_format):
+    """
+    Return the record codec for `record_format`, a struct format string or a
+    NumPy dtype (anything that is not a str is passed to numpy.dtype()).
+    """
+    if isinstance(record_format, str):
+        return StructRecords(record_format)
+    return NumpyRecords(record_format)
+
+
+class RecordBuffer:
+    """
+    List like memory buffer of fixed size records packed back to back in a
+    bytearray. Records are consumed from the front by moving an offset, so
+    pop(0) does not shift the remaining records.
+    """
+
+    def __init__(self, records, data=b''):
+        self.records = records
+        self.data = bytearray(data)
+        self.offset = 0
+
+    def __len__(self):
+        return (len(self.data) - self.offset) // self.records.itemsize
+
+    def __bool__(self):
+        return len(self.data) > self.offset
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError('RecordBuffer slices do not support a step')
+            return self.records.batch(self.data, self.offset + start * self.records.itemsize,
+                                      max(0, stop - start))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('RecordBuffer index out of range')
+        return self.records.unpack_from(self.data, self.offset + index * self.records.itemsize)
+
+    def append(self, obj):
+        self.data += self.records.pack(obj)
+
+    def pop(self, index=0):
+        if index != 0:
+            raise ValueError('RecordBuffer only supports pop(0)')
+        obj = self[0]
+        self.offset += self.records.itemsize
+        return obj
+
+    def take(self, count):
+        """ Remove & return up to `count` records from the front as a batch"""
+        count = min(count, len(self))
+        batch = self.records.batch(self.data, self.offset, count)
+        self.offset += count * self.records.itemsize
+        return batch
+
+    def pack_chunk(self):
+        payload = memoryview(self.data)[self.offset:]
+        return b''.join([CHUNK_HEADER.pack(CHUNK_MAGIC, self.records.itemsize, len(payload)), payload])
+
+    @classmethod
+    def unpack_chunk(cls, records, data):
+        magic, itemsize, size = CHUNK_HEADER.unpack_from(data)
+        if magic != CHUNK_MAGIC or itemsize != records.itemsize:
+            raise ValueError("chunk was not written with this queue's 'record_format'")
+        return cls(records, memoryview(data)[CHUNK_HEADER.size:CHUNK_HEADER.size + size])
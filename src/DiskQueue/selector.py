@@ -0,0 +1,169 @@
+import threading
+from time import monotonic
+
+from .exceptions import Empty
+
+
+class _Entry:
+    """ Scheduling state of a queue registered with a QueueSelector"""
+
+    def __init__(self, queue, weight, rate, burst):
+        self.queue = queue
+        self.weight = weight
+        self.rate = rate
+        self.burst = burst or (max(1, rate) if rate else None)
+        self.tokens = self.burst
+        self.updated = monotonic()
+        # Smooth weighted round robin counter.
+        self.current = 0
+
+    def refill(self, now):
+        if self.rate is None:
+            return
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self, max_items):
+        if self.rate is None:
+            return max_items
+        return min(max_items, int(self.tokens))
+
+    def wait_time(self):
+        """ Seconds until the next token is available"""
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def consume(self, count):
+        if self.rate is not None:
+            self.tokens -= count
+
+
+class QueueSelector:
+    """
+    Consume many DiskQueues from one pool of consumers.
+
+    select() blocks on a single condition variable that every registered
+    queue notifies on put(), instead of polling each queue's `not_empty`.
+    Non empty queues are picked by smooth weighted round robin so a queue
+    with a huge backlog cannot starve the others, & a queue registered with
+    a `rate` (items per second) is limited by a token bucket holding up to
+    `burst` items.
+    """
+
+    def __init__(self, queues=None):
+        self._entries = []
+        self._lock = threading.Lock()
+
+        # Bumped & notified by every put() on a registered queue, a consumer
+        # only waits if nothing was put since it last looked at the queues.
+        self._wakeup = threading.Condition(threading.Lock())
+        self._version = 0
+
+        for queue in queues or []:
+            self.register(queue)
+
+    def register(self, queue, weight=1, rate=None, burst=None):
+        if weight <= 0:
+            raise ValueError("'weight' must be a positive number")
+        if rate is not None and rate <= 0:
+            raise ValueError("'rate' must be a positive number")
+
+        with self._lock:
+            self._entries.append(_Entry(queue, weight, rate, burst))
+        queue._add_listener(self._notify)
+        self._notify()
+
+    def unregister(self, queue):
+        queue._remove_listener(self._notify)
+        with self._lock:
+            self._entries = [entry for entry in self._entries if entry.queue is not queue]
+
+    def close(self):
+        for entry in list(self._entries):
+            self.unregister(entry.queue)
+
+    def _notify(self):
+        # Called by the queues with their mutex held, `_wakeup` is never held
+        # while taking a queue mutex so this cannot deadlock.
+        with self._wakeup:
+            self._version += 1
+            self._wakeup.notify_all()
+
+    def _pick(self, max_items):
+        # Must be called with `self._lock` held.
+        now = monotonic()
+        candidates = []
+        wait = None
+
+        for entry in self._entries:
+            if not entry.queue.qsize():
+                continue
+            entry.refill(now)
+            count = entry.available(max_items)
+            if count < 1:
+                wait = entry.wait_time() if wait is None else min(wait, entry.wait_time())
+                continue
+            candidates.append((entry, count))
+
+        if not candidates:
+            return None, 0, wait
+
+        total = sum(entry.weight for entry, count in candidates)
+        for entry, count in candidates:
+            entry.current += entry.weight
+        entry, count = max(candidates, key=lambda candidate: candidate[0].current)
+        entry.current -= total
+        entry.consume(count)
+        return entry, count, None
+
+    def _select_once(self, max_items):
+        while True:
+            with self._lock:
+                entry, count, wait = self._pick(max_items)
+            if entry is None:
+                return None, wait
+
+            try:
+                objects = entry.queue.get_many(count, block=False)
+            except Empty:
+                # Drained by another consumer since qsize() was read.
+                objects = []
+
+            with self._lock:
+                entry.consume(len(objects) - count)
+            if len(objects):
+                return (entry.queue, objects), None
+
+    def select(self, max_items=1, block=True, timeout=None):
+        """
+        Return a (queue, objects) tuple with up to `max_items` objects taken
+        from the next queue in weighted round robin order that has items & is
+        within its rate limit. Blocks & raises Empty like DiskQueue.get().
+        The caller is responsible for calling task_done() on the queue.
+        """
+
+        if max_items <= 0:
+            raise ValueError("'max_items' must be a positive integer")
+        if block and timeout is not None and timeout < 0:
+            raise ValueError("'timeout' must be a non-negative number")
+
+        endtime = None if timeout is None else monotonic() + timeout
+
+        while True:
+            with self._wakeup:
+                version = self._version
+
+            result, wait = self._select_once(max_items)
+            if result is not None:
+                return result
+            if not block:
+                raise Empty
+
+            if endtime is not None:
+                time_left = endtime - monotonic()
+                if time_left <= 0.0:
+                    raise Empty
+                wait = time_left if wait is None else min(wait, time_left)
+
+            with self._wakeup:
+                if self._version == version:
+                    self._wakeup.wait(wait)
@@ -0,0 +1,251 @@
+import os
+import struct
+import threading
+import zlib
+
+from . import chunk_io
+
+
+class WriteAheadLog:
+    """
+    Log of the items in a queue's memory buffers that are not in a chunk
+    file, & of how far the get buffer was consumed.
+
+    The log starts with a header naming the chunk index (the queue's tail)
+    the put buffer will be flushed to, followed by crc32 protected records.
+    Item records hold a packed item & the hash of its dedup key. Cursor
+    records say where the get buffer comes from, either a chunk file or a
+    range of the log's own item records (the put buffer handed over in
+    memory), & how many of its items were handed out. Items after the get
+    buffer's range belong to the put buffer, they are discarded on replay if
+    the header names a chunk index other than the recovered tail since that
+    chunk was already flushed.
+
+    Appends happen with the queue mutex held, wait_durable() is called after
+    releasing it & performs a group commit: one thread syncs the log on behalf
+    of every record appended so far while the others wait for it. Cursor
+    records are appended without a sync, after a power loss the last items
+    handed out may be delivered again.
+
+    The log is never truncated in place, it is rewritten with only its live
+    records into a temporary file that replaces it once synced, whenever the
+    put buffer is flushed, a chunk is loaded into the get buffer or consumed
+    records make up most of it.
+    """
+
+    HEADER = struct.Struct('<4sq')
+    MAGIC = b'DQW1'
+    # kind, key hash (0 for none), payload size, crc32 of the record
+    RECORD = struct.Struct('<BQII')
+    # source, chunk index or first item, last item (exclusive), items consumed
+    CURSOR_DATA = struct.Struct('<Bqqq')
+
+    ITEM = 1
+    CURSOR = 2
+
+    # Sources of the get buffer named by a cursor.
+    CHUNK = 1
+    LOG = 2
+
+    # The log is rewritten once it grows past this size & twice its live size.
+    COMPACT_BYTES = 1 << 20
+
+    def __init__(self, file_name, io_mode=chunk_io.BUFFERED):
+        self.file_name = file_name
+        self.io_mode = io_mode
+        self.fd = os.open(file_name, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+
+        self.tail = None
+        # Item records in the log, the get buffer's range if it comes from
+        # the log, then the put buffer starting at `_put_start`.
+        self._items = []
+        self._put_start = 0
+        self._cursor = None
+        self._size = 0
+        self._compact_at = self.COMPACT_BYTES
+
+        self._written = 0
+        self._durable = 0
+        self._syncing = False
+        self._cond = threading.Condition(threading.Lock())
+
+    def _crc(self, kind, key, payload):
+        return zlib.crc32(payload, kind ^ zlib.crc32(key.to_bytes(8, 'little')))
+
+    def _record(self, kind, payload, key=None):
+        key = key or 0
+        return b''.join([self.RECORD.pack(kind, key, len(payload), self._crc(kind, key, payload)), payload])
+
+    def replay(self, head, tail):
+        """
+        Return the state logged before a crash as a (chunk cursor, get items,
+        put items) tuple. The chunk cursor is the (index, consumed) of the
+        chunk file that backed the get buffer or None, the items are lists of
+        (payload, key hash). A torn record at the end of the log (crash in the
+        middle of an append) & anything after it is dropped.
+        """
+        with open(self.file_name, 'rb') as fp:
+            data = fp.read()
+
+        records = []
+        cursor = None
+        stale = True
+        if len(data) >= self.HEADER.size:
+            magic, log_tail = self.HEADER.unpack_from(data)
+            if magic == self.MAGIC:
+                stale = log_tail != tail
+                offset = self.HEADER.size
+                while offset + self.RECORD.size <= len(data):
+                    kind, key, size, crc = self.RECORD.unpack_from(data, offset)
+                    start = offset + self.RECORD.size
+                    payload = data[start:start + size]
+                    if len(payload) != size or self._crc(kind, key, payload) != crc:
+                        break
+                    if kind == self.CURSOR:
+                        cursor = self.CURSOR_DATA.unpack(payload)
+                    else:
+                        records.append((data[offset:start + size], payload, key or None))
+                    offset = start + size
+
+        chunk = None
+        get_records, put_records = [], records
+        if cursor is not None and cursor[0] == self.LOG:
+            source, first, last, consumed = cursor
+            get_records, put_records = records[first + consumed:last], records[last:]
+        elif cursor is not None and cursor[1] == head - 1:
+            # Unless the index moved past the chunk it is still the head chunk.
+            chunk = (cursor[1], cursor[3])
+        if stale:
+            put_records = []
+
+        self.tail = tail
+        self._items = [record for record, payload, key in get_records + put_records]
+        self._put_start = len(get_records)
+        if get_records:
+            self._cursor = (self.LOG, 0, len(get_records), 0)
+        elif chunk is not None:
+            self._cursor = (self.CHUNK, chunk[0], 0, chunk[1])
+        self._rewrite()
+
+        return (chunk, [(payload, key) for record, payload, key in get_records],
+                [(payload, key) for record, payload, key in put_records])
+
+    def _live_start(self):
+        if self._cursor is not None and self._cursor[0] == self.LOG:
+            return self._cursor[1] + self._cursor[3]
+        return self._put_start
+
+    def _rewrite(self):
+        """ Replace the log with its live records, must be called with the queue mutex held"""
+        start = self._live_start()
+        self._items = self._items[start:]
+        self._put_start -= start
+        if self._cursor is not None and self._cursor[0] == self.LOG:
+            self._cursor = (self.LOG, 0, self._put_start, 0)
+
+        records = [self.HEADER.pack(self.MAGIC, self.tail)] + self._items
+        if self._cursor is not None:
+            records.append(self._record(self.CURSOR, self.CURSOR_DATA.pack(*self._cursor)))
+        data = b''.join(records)
+
+        tmp_name = self.file_name + '.tmp'
+        fd = os.open(tmp_name, os.O_RDWR | os.O_CREAT | os.O_TRUNC | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, data)
+            chunk_io.sync_fd(fd, self.io_mode)
+            os.replace(tmp_name, self.file_name)
+        except BaseException:
+            os.close(fd)
+            raise
+        dir_fd = os.open(os.path.dirname(self.file_name) or '.', os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+        with self._cond:
+            # A group commit may still be syncing the old log.
+            while self._syncing:
+                self._cond.wait()
+            old_fd, self.fd = self.fd, fd
+            self._durable = self._written
+            self._cond.notify_all()
+        os.close(old_fd)
+
+        self._size = len(data)
+        self._compact_at = max(self.COMPACT_BYTES, 2 * self._size)
+
+    def _append(self, record):
+        os.write(self.fd, record)
+        self._size += len(record)
+
+    def append(self, payload, key=None):
+        """ Log an item put in the put buffer, returns the sequence no. to pass to wait_durable()"""
+        record = self._record(self.ITEM, payload, key)
+        self._append(record)
+        self._items.append(record)
+        with self._cond:
+            self._written += 1
+            return self._written
+
+    def _write_cursor(self):
+        self._append(self._record(self.CURSOR, self.CURSOR_DATA.pack(*self._cursor)))
+        if self._size > self._compact_at:
+            self._rewrite()
+
+    def handoff(self):
+        """ Log that the put buffer was moved to the (empty) get buffer"""
+        self._cursor = (self.LOG, self._put_start, len(self._items), 0)
+        self._put_start = len(self._items)
+        self._write_cursor()
+
+    def consume(self, count):
+        """ Log that `count` items of the get buffer were handed out"""
+        if self._cursor is None:
+            return
+        self._cursor = self._cursor[:3] + (count,)
+        self._write_cursor()
+
+    def load_chunk(self, index):
+        """ Log that chunk `index` was loaded into the (empty) get buffer"""
+        self._cursor = (self.CHUNK, index, 0, 0)
+        self._rewrite()
+
+    def flush(self, tail):
+        """ Drop the put buffer's items once it was flushed to a chunk, new items belong to chunk `tail`"""
+        self._items = self._items[:self._put_start]
+        self.tail = tail
+        self._rewrite()
+
+    def sync(self):
+        """ Sync every record appended so far"""
+        with self._cond:
+            target = self._written
+            fd = self.fd
+        chunk_io.sync_fd(fd, self.io_mode)
+        with self._cond:
+            self._durable = max(self._durable, target)
+            self._cond.notify_all()
+
+    def wait_durable(self, seq):
+        """ Block until the record `seq` is synced to disk"""
+        with self._cond:
+            while self._durable < seq:
+                if self._syncing:
+                    self._cond.wait()
+                    continue
+
+                self._syncing = True
+                target = self._written
+                fd = self.fd
+                self._cond.release()
+                try:
+                    chunk_io.sync_fd(fd, self.io_mode)
+                finally:
+                    self._cond.acquire()
+                    self._syncing = False
+                self._durable = max(self._durable, target)
+                self._cond.notify_all()
+
+    def close(self):
+        os.close(self.fd)
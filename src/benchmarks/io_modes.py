@@ -0,0 +1,51 @@
+"""
+Compare put/get throughput of the chunk file I/O modes.
+
+    $ cd src && python -m benchmarks.io_modes --items 20000 --cache-size 100
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+from DiskQueue import DiskQueue
+from DiskQueue import chunk_io
+
+
+def bench(io_mode, items, cache_size, path):
+    queue = f'bench-{io_mode}'
+    diskq = DiskQueue(path=path, queue_name=queue, cache_size=cache_size, io_mode=io_mode)
+    obj = {'id': 0, 'payload': 'x' * 64}
+
+    start = time.perf_counter()
+    for i in range(items):
+        diskq.put(obj)
+    put_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(items):
+        diskq.get()
+    get_time = time.perf_counter() - start
+
+    shutil.rmtree(f'{path}/{queue}')
+    return put_time, get_time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=20000)
+    parser.add_argument('--cache-size', type=int, default=100)
+    parser.add_argument('--path', default=None, help='directory to create the queues in')
+    args = parser.parse_args()
+
+    path = args.path or tempfile.mkdtemp()
+    print(f'{"mode":<14}{"put/s":>12}{"get/s":>12}')
+    for io_mode in chunk_io.IO_MODES:
+        put_time, get_time = bench(io_mode, args.items, args.cache_size, path)
+        print(f'{io_mode:<14}{args.items / put_time:>12.0f}{args.items / get_time:>12.0f}')
+    if not args.path:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()
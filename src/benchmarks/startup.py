@@ -0,0 +1,80 @@
+"""
+Measure the import time of the package & the time to open (& first get from)
+a queue directory holding many chunk files.
+
+    $ cd src && python -m benchmarks.startup --chunks 100000 --queues 10
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from DiskQueue import DiskQueue
+from DiskQueue import chunk_io
+
+
+def bench_import(runs):
+    best = float('inf')
+    for i in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'import DiskQueue'], check=True)
+        best = min(best, time.perf_counter() - start)
+
+    baseline = float('inf')
+    for i in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'pass'], check=True)
+        baseline = min(baseline, time.perf_counter() - start)
+    return best - baseline
+
+
+def make_queue(path, queue_name, chunks, cache_size):
+    # Chunk files & the index are written directly, going through put() would
+    # fsync every one of them.
+    queue_dir = os.path.join(path, queue_name)
+    os.mkdir(queue_dir)
+    payload = chunk_io.pack_chunk(list(range(cache_size)))
+    for index in range(chunks):
+        with open(os.path.join(queue_dir, str(index)), 'wb') as fp:
+            fp.write(payload)
+    with open(os.path.join(queue_dir, '000'), 'w') as fp:
+        fp.write(f'0,{chunks},{chunks * cache_size}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunks', type=int, default=100000)
+    parser.add_argument('--cache-size', type=int, default=100)
+    parser.add_argument('--queues', type=int, default=10)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f'import DiskQueue          : {bench_import(args.runs) * 1000:8.2f} ms')
+
+    path = tempfile.mkdtemp()
+    try:
+        names = [f'bench-{i}' for i in range(args.queues)]
+        for name in names:
+            make_queue(path, name, args.chunks // args.queues, args.cache_size)
+
+        start = time.perf_counter()
+        queues = [DiskQueue(path=path, queue_name=name, cache_size=args.cache_size)
+                  for name in names]
+        open_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for diskq in queues:
+            diskq.get()
+        get_time = time.perf_counter() - start
+
+        print(f'open {args.queues} queues, {args.chunks} chunks : {open_time * 1000:8.2f} ms')
+        print(f'first get() per queue    : {get_time / args.queues * 1000:8.2f} ms')
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Compare the cost of durable puts: sync() after every put versus the write
+ahead log with group commit, with a number of producer threads.
+
+    $ cd src && python -m benchmarks.wal --items 2000 --threads 8
+"""
+import argparse
+import shutil
+import tempfile
+import threading
+import time
+
+from DiskQueue import DiskQueue
+
+
+def run(diskq, items, threads, durable_put):
+    def producer():
+        for i in range(items // threads):
+            durable_put(diskq, {'id': i})
+
+    workers = [threading.Thread(target=producer) for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return items / (time.perf_counter() - start)
+
+
+def put_and_sync(diskq, obj):
+    diskq.put(obj)
+    diskq.sync()
+
+
+def put(diskq, obj):
+    diskq.put(obj)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--cache-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp()
+    try:
+        cases = [
+            ('put + sync()', dict(), put_and_sync),
+            ('wal=True', dict(wal=True), put),
+            ('no durability', dict(), put),
+        ]
+        for i, (name, kwargs, durable_put) in enumerate(cases):
+            diskq = DiskQueue(path=path, queue_name=f'bench-{i}', cache_size=args.cache_size, **kwargs)
+            rate = run(diskq, args.items, args.threads, durable_put)
+            print(f'{name:<16}{rate:>12.0f} puts/s')
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,21 @@
+
+from DiskQueue import DiskQueue, WorkerPool
+import time
+
+
+def enrich(obj):
+    # CPU heavy work runs in a worker process, outside of the GIL of this one.
+    sum(i * i for i in range(obj['data'] * 1000))
+
+
+if __name__ == '__main__':
+    diskq = DiskQueue(path='./', queue_name='es-miss', cache_size=4)
+
+    for i in range(200):
+        diskq.put({'data': i})
+
+    # At most 8 batches of 10 items are handed to the 4 worker processes at once.
+    with WorkerPool(diskq, enrich, workers=4, batch_size=10, max_in_flight=8) as pool:
+        pool.join()
+
+    print(pool.stats())
@@ -0,0 +1,125 @@
+"""
+Child process used by test_crash.py, runs producers (& optionally a consumer)
+against a DiskQueue & SIGKILLs itself on the `kill_after`-th kill point: a
+chunk write, an fsync, a raw write (log appends & rewrites, cursor records,
+in place chunk writes), a rename or a file removal (log rewrites, chunk
+files recycled or removed). Every put() that returned is reported on stdout
+as `ack <item>` & every item handed out by get() as `got <item>`.
+
+    python crash_worker.py <path> <queue_name> <mode> <kill_after> <producers> <items> [<config>]
+
+`mode` is one of 'wal' (put with wal=True), 'sync' (sync() after each put)
+or 'mixed' (wal=True with a consumer thread). `config` is one of CONFIGS,
+'buffered' by default.
+"""
+import os
+import signal
+import sys
+import threading
+
+from DiskQueue import ChunkCache, DiskQueue
+from DiskQueue import chunk_io
+
+
+# Extra DiskQueue arguments of each configuration.
+CONFIGS = {
+    'buffered': {},
+    'preallocated': {'io_mode': chunk_io.PREALLOCATED},
+    'direct': {'io_mode': chunk_io.DIRECT},
+    'cache': {'chunk_cache': None},
+    'dedup': {'dedup_window': 1000},
+}
+
+
+def queue_options(config):
+    options = dict(CONFIGS[config])
+    if 'chunk_cache' in options:
+        options['chunk_cache'] = ChunkCache(budget_bytes=256)
+    return options
+
+
+def inject_kill(kill_after):
+    calls = [0]
+    sync_fd, write_chunk = chunk_io.sync_fd, chunk_io.write_chunk
+    write, replace, remove = os.write, os.replace, os.remove
+
+    def tick():
+        calls[0] += 1
+        if calls[0] >= kill_after:
+            os.kill(os.getpid(), signal.SIGKILL)
+
+    def killing_write(fd, data):
+        if calls[0] + 1 >= kill_after:
+            # Leave a torn record or chunk behind.
+            try:
+                write(fd, bytes(data[:len(data) // 2]))
+            except OSError:
+                # Unaligned O_DIRECT write, the kill happens before it.
+                pass
+        tick()
+        return write(fd, data)
+
+    def killing_replace(src, dst):
+        tick()
+        replace(src, dst)
+
+    def killing_remove(path):
+        tick()
+        remove(path)
+
+    def killing_sync_fd(fd, io_mode=chunk_io.BUFFERED):
+        tick()
+        sync_fd(fd, io_mode)
+
+    def killing_write_chunk(file_name, payload, io_mode=chunk_io.BUFFERED):
+        if calls[0] + 1 >= kill_after:
+            # Leave a torn chunk file behind.
+            with open(file_name, 'wb') as fp:
+                fp.write(payload[:len(payload) // 2])
+        tick()
+        write_chunk(file_name, payload, io_mode)
+
+    chunk_io.sync_fd = killing_sync_fd
+    chunk_io.write_chunk = killing_write_chunk
+    os.write, os.replace, os.remove = killing_write, killing_replace, killing_remove
+
+
+def main():
+    path, queue_name, mode = sys.argv[1:4]
+    kill_after, producers, items = [int(x) for x in sys.argv[4:7]]
+    config = sys.argv[7] if len(sys.argv) > 7 else 'buffered'
+    options = queue_options(config)
+
+    diskq = DiskQueue(path=path, queue_name=queue_name, cache_size=5, wal=mode in ('wal', 'mixed'), **options)
+    inject_kill(kill_after)
+
+    out = threading.Lock()
+
+    def report(kind, obj):
+        with out:
+            sys.stdout.write(f'{kind} {obj}\n')
+            sys.stdout.flush()
+
+    def producer(producer_id):
+        for i in range(items):
+            obj = producer_id * items + i
+            diskq.put(obj, key=obj if 'dedup_window' in options else None)
+            if mode == 'sync':
+                diskq.sync()
+            report('ack', obj)
+
+    def consumer():
+        while True:
+            report('got', diskq.get())
+
+    threads = [threading.Thread(target=producer, args=(i,)) for i in range(producers)]
+    if mode == 'mixed':
+        threading.Thread(target=consumer, daemon=True).start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+from DiskQueue import DiskQueue, ChunkCache
+import os
+import pytest
+import shutil
+
+
+def remove_queue(queue):
+    shutil.rmtree(queue)
+
+
+def chunk_files(queue):
+    return sorted(f for f in os.listdir(queue) if f.lstrip('-').isdigit() and f != '000')
+
+
+def test_chunks_stay_in_memory_under_budget():
+    cache_size = 2
+    queue = 'testq'
+    datadir = './'
+    cache = ChunkCache(budget_bytes=1 << 20)
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size, chunk_cache=cache)
+
+    for i in range(20):
+        diskq.put(i)
+
+    assert chunk_files(queue) == []
+    assert cache.stats()['size'] > 0
+
+    for i in range(20):
+        assert diskq.get() == i
+
+    assert cache.stats()['size'] == 0
+    assert cache.stats()['spills'] == 0
+    remove_queue(queue)
+
+
+def test_chunks_spill_to_disk_over_budget():
+    cache_size = 2
+    queue = 'testq'
+    datadir = './'
+    cache = ChunkCache(budget_bytes=10)
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size, chunk_cache=cache)
+
+    for i in range(20):
+        diskq.put(i)
+
+    assert cache.stats()['size'] <= 10
+    assert cache.stats()['spills'] > 0
+    assert chunk_files(queue)
+
+    for i in range(20):
+        assert diskq.get() == i
+    assert diskq.empty()
+    remove_queue(queue)
+
+
+def test_coldest_queue_spills_first():
+    cache_size = 2
+    datadir = './'
+    cache = ChunkCache(budget_bytes=1 << 20)
+    cold = DiskQueue(path=datadir, queue_name='coldq', cache_size=cache_size, chunk_cache=cache)
+    hot = DiskQueue(path=datadir, queue_name='hotq', cache_size=cache_size, chunk_cache=cache)
+
+    for i in range(5):
+        cold.put(i)
+    for i in range(5):
+        hot.put(i)
+
+    # Shrink the budget so the next chunk stored pushes it over.
+    cache.budget_bytes = cache.stats()['size']
+    hot.put(5)
+    hot.put(6)
+
+    assert chunk_files('coldq')
+    assert chunk_files('hotq') == []
+    assert [cold.get() for i in range(5)] == list(range(5))
+    assert [hot.get() for i in range(7)] == list(range(7))
+    remove_queue('coldq')
+    remove_queue('hotq')
+
+
+def test_sync_spills_cached_chunks_for_recovery():
+    cache_size = 2
+    queue = 'testq'
+    datadir = './'
+    cache = ChunkCache(budget_bytes=1 << 20)
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size, chunk_cache=cache)
+
+    for i in range(7):
+        diskq.put(i)
+    diskq.sync()
+
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size)
+    assert len(diskq) == 7
+    assert [diskq.get() for i in range(7)] == list(range(7))
+    remove_queue(queue)
+
+
+def test_recovery_skips_chunks_lost_from_memory():
+    cache_size = 2
+    queue = 'testq'
+    datadir = './'
+    cache = ChunkCache(budget_bytes=1 << 20)
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size, chunk_cache=cache)
+
+    for i in range(4):
+        diskq.put(i)
+    diskq.sync()
+    for i in range(4, 10):
+        diskq.put(i)
+
+    # Simulate a crash, the chunks held by the cache were never written.
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size)
+    assert len(diskq) == 4
+    assert [diskq.get() for i in range(4)] == list(range(4))
+    assert diskq.empty()
+
+    diskq.put(10)
+    assert diskq.get() == 10
+    remove_queue(queue)
+
+
+def test_keys_of_cached_chunks_are_committed_on_spill():
+    cache_size = 2
+    queue = 'testq'
+    datadir = './'
+    cache = ChunkCache(budget_bytes=1 << 20)
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size, chunk_cache=cache,
+                      dedup_window=100)
+
+    for i in range(3):
+        assert diskq.put(i, key=f'k{i}')
+    assert not diskq.put(0, key='k0')
+
+    # Dropped without close(), the cached chunk is lost so its keys must be
+    # free to be put again.
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size, chunk_cache=ChunkCache(1 << 20),
+                      dedup_window=100)
+    assert len(diskq) == 0
+    assert diskq.put(0, key='k0')
+
+    diskq.sync()
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size, dedup_window=100)
+    assert len(diskq) == 1
+    assert not diskq.put(0, key='k0')
+    remove_queue(queue)
+
+
+def test_dropped_queue_leaves_the_cache():
+    cache = ChunkCache(budget_bytes=1 << 20)
+    diskq = DiskQueue(path='./', queue_name='testq', cache_size=2, chunk_cache=cache)
+    for i in range(10):
+        diskq.put(i)
+    assert cache.stats()['size'] > 0
+
+    del diskq
+    assert cache.stats() == {'queues': 0, 'size': 0, 'budget_bytes': 1 << 20, 'hits': 0, 'spills': 0}
+    remove_queue('testq')
+
+
+def test_closed_queue_raises_value_error():
+    cache = ChunkCache(budget_bytes=1 << 20)
+    diskq = DiskQueue(path='./', queue_name='testq', cache_size=2, chunk_cache=cache)
+    diskq.put(0)
+    diskq.close()
+
+    with pytest.raises(ValueError):
+        cache.get(diskq, 0)
+    remove_queue('testq')
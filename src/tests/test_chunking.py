@@ -184,7 +184,7 @@ def test_tail_pointer_sync_to_disk_on_increment():
     index_file = os.path.join(datadir, os.path.join(queue,'000'))
     
     with open(index_file) as f:
-        head , tail = [int(x) for x in f.read().split(',')]
+        head , tail = [int(x) for x in f.read().split(',')][:2]
    
     assert tail  == diskq.tail 
     remove_queue(queue)
@@ -241,7 +241,7 @@ def test_head_pointer_syncs_to_disk_after_get_exceeds_buffer_size():
     index_file = os.path.join(datadir, os.path.join(queue,'000'))
     
     with open(index_file) as f:
-        head , tail = [int(x) for x in f.read().split(',')]
+        head , tail = [int(x) for x in f.read().split(',')][:2]
    
     assert head  == diskq.head 
     remove_queue(queue)
@@ -427,10 +427,135 @@ def test_queue_size():
     
     for i in range(5):
         diskq.put(i)
-    # TODO add a public method qsize() on queue Object
     assert len(diskq) == 5
-    
+    assert diskq.qsize() == 5
+
+    remove_queue(queue)
+
+
+def test_queue_empty_and_full():
+
+    cache_size = 2
+    max_size = 3
+    queue = 'testq'
+    datadir = './'
+
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size, max_size=max_size)
+
+    assert diskq.empty()
+    assert not diskq.full()
+
+    for i in range(3):
+        diskq.put(i)
+
+    assert not diskq.empty()
+    assert diskq.full()
+
+    diskq.get()
+    assert not diskq.full()
+
+    remove_queue(queue)
+
+
+def test_queue_size_is_exact_after_partial_sync():
+
+    cache_size = 4
+    queue = 'testq'
+    datadir = './'
+
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size)
+
+    for i in range(3):
+        diskq.put(i)
+    diskq.sync()
+
+    for i in range(3, 5):
+        diskq.put(i)
 
+    assert diskq.qsize() == 5
+
+    diskq.get()
+    assert diskq.qsize() == 4
 
     remove_queue(queue)
 
+
+def test_queue_size_persisted_in_index_file():
+
+    cache_size = 4
+    queue = 'testq'
+    datadir = './'
+
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size)
+
+    for i in range(3):
+        diskq.put(i)
+    diskq.sync()
+
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size)
+    assert diskq.qsize() == 3
+
+    for i in range(3):
+        assert diskq.get() == i
+    assert diskq.empty()
+
+    remove_queue(queue)
+
+
+
+def test_queue_open_defers_loading_head_chunk():
+    cache_size = 2
+    queue = 'testq'
+    datadir = './'
+
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size)
+    for i in range(6):
+        diskq.put(i)
+    diskq.sync()
+
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size)
+
+    # Only the index file is read when the queue is opened.
+    assert diskq.get_memory_buffer == []
+    assert os.path.exists(os.path.join(datadir, queue, str(diskq.head)))
+    assert len(diskq) == 6
+
+    assert diskq.get() == 0
+    assert not os.path.exists(os.path.join(datadir, queue, '0'))
+    remove_queue(queue)
+
+
+def test_queue_reopen_without_chunks_on_disk():
+    cache_size = 2
+    queue = 'testq'
+    datadir = './'
+
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size)
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size)
+
+    assert diskq.head == diskq.tail == 0
+
+    diskq.put(1)
+    assert diskq.get() == 1
+    remove_queue(queue)
+
+
+def test_peek_after_reopen_reads_from_head():
+    cache_size = 2
+    queue = 'testq'
+    datadir = './'
+
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size)
+    for i in range(6):
+        diskq.put(i)
+    for i in range(3):
+        diskq.get()
+    diskq.sync()
+
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size)
+    diskq.put(6)
+
+    assert diskq.peek() == 3
+    assert diskq.peek(10) == [3, 4, 5, 6]
+    assert [diskq.get() for i in range(4)] == [3, 4, 5, 6]
+    remove_queue(queue)
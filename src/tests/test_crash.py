@@ -0,0 +1,119 @@
+from DiskQueue import DiskQueue
+from DiskQueue.exceptions import Empty
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import pytest
+
+
+pytestmark = pytest.mark.skipif(not hasattr(signal, 'SIGKILL'), reason='needs SIGKILL')
+
+WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'crash_worker.py')
+PRODUCERS = 3
+ITEMS = 40
+# Kill points are drawn from 1..KILL_POINTS, a run that passes fewer of them
+# completes without being killed.
+KILL_POINTS = 300
+
+
+def remove_queue(queue):
+    shutil.rmtree(queue)
+
+
+def run_worker(queue, mode, kill_after, config='buffered'):
+    env = dict(os.environ)
+    src_dir = os.path.dirname(os.path.dirname(WORKER))
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [src_dir, env.get('PYTHONPATH')]))
+
+    proc = subprocess.run(
+        [sys.executable, WORKER, './', queue, mode, str(kill_after), str(PRODUCERS), str(ITEMS), config],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, timeout=60,
+    )
+    assert proc.returncode in (0, -signal.SIGKILL), proc.stderr.decode()
+
+    acked, got = [], []
+    for line in proc.stdout.decode().splitlines():
+        kind, obj = line.split()
+        (acked if kind == 'ack' else got).append(int(obj))
+    return acked, got
+
+
+def drain(queue, wal, config='buffered'):
+    # Reopened with the dedup window so replayed keys are kept.
+    dedup_window = 1000 if config == 'dedup' else None
+    diskq = DiskQueue(path='./', queue_name=queue, cache_size=5, wal=wal, dedup_window=dedup_window)
+    recovered = []
+    while True:
+        try:
+            objects = diskq.get_many(100, block=False)
+        except Empty:
+            break
+        # The recovered size must never count items that are not there.
+        assert len(objects)
+        recovered.extend(objects)
+    assert len(diskq) == 0
+    diskq.close()
+    return recovered
+
+
+def assert_keys_seen(queue, config, objects, wal):
+    # Keys of the items that made it into the queue are still deduplicated.
+    # Without the log the keys of the last chunk flushed (up to `cache_size`
+    # items) are lost if the process is killed after the index counts it but
+    # before they are committed.
+    if config != 'dedup':
+        return
+    diskq = DiskQueue(path='./', queue_name=queue, cache_size=5, dedup_window=1000)
+    assert sum(diskq.put(obj, key=obj) for obj in objects) <= (0 if wal else 5)
+
+
+def assert_fifo_per_producer(objects):
+    for producer_id in range(PRODUCERS):
+        own = [obj for obj in objects if obj // ITEMS == producer_id]
+        assert own == sorted(own)
+
+
+@pytest.mark.parametrize('mode, config', [
+    ('wal', 'buffered'), ('wal', 'preallocated'), ('wal', 'direct'), ('wal', 'dedup'),
+    ('sync', 'buffered'), ('sync', 'preallocated'), ('sync', 'direct'), ('sync', 'dedup'), ('sync', 'cache'),
+])
+@pytest.mark.parametrize('seed', range(6))
+def test_acked_puts_survive_sigkill(mode, config, seed):
+    queue = f'crashq-{mode}-{config}-{seed}'
+    kill_after = random.Random(seed).randint(1, KILL_POINTS)
+
+    acked, got = run_worker(queue, mode, kill_after, config)
+    recovered = drain(queue, wal=mode == 'wal', config=config)
+
+    # No loss of acknowledged items, no duplicates, nothing invented.
+    assert set(acked) <= set(recovered)
+    assert len(recovered) == len(set(recovered))
+    assert set(recovered) <= set(range(PRODUCERS * ITEMS))
+    assert_fifo_per_producer(recovered)
+    assert_keys_seen(queue, config, recovered, wal=mode == 'wal')
+    remove_queue(queue)
+
+
+# The chunk cache can't be combined with the write ahead log.
+@pytest.mark.parametrize('config', ['buffered', 'preallocated', 'direct', 'dedup'])
+@pytest.mark.parametrize('seed', range(6))
+def test_consumed_items_are_not_duplicated_after_sigkill(config, seed):
+    queue = f'crashq-mixed-{config}-{seed}'
+    kill_after = random.Random(seed).randint(1, KILL_POINTS)
+
+    acked, got = run_worker(queue, 'mixed', kill_after, config)
+    recovered = drain(queue, wal=True, config=config)
+
+    assert len(got) == len(set(got))
+    assert len(recovered) == len(set(recovered))
+    assert not set(got) & set(recovered)
+    # No acknowledged item is lost, except the one the consumer thread may
+    # have taken with get() but not reported yet when the process was killed.
+    assert len(set(acked) - set(got) - set(recovered)) <= 1
+    assert set(recovered) <= set(range(PRODUCERS * ITEMS))
+    assert_fifo_per_producer(got + recovered)
+    assert_keys_seen(queue, config, got + recovered, wal=True)
+    remove_queue(queue)
@@ -0,0 +1,140 @@
+from DiskQueue import DiskQueue
+from DiskQueue.dedup import BloomFilter, KeyIndex, key_hash
+import os
+import pytest
+import shutil
+
+
+def remove_queue(queue):
+    shutil.rmtree(queue)
+
+
+def test_put_skips_duplicate_keys():
+    cache_size = 2
+    queue = 'testq'
+    datadir = './'
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size, dedup_window=100)
+
+    assert diskq.put('a', key='event-1') is True
+    assert diskq.put('b', key='event-2') is True
+    assert diskq.put('a', key='event-1') is False
+    assert diskq.put('c', key='event-3') is True
+    assert diskq.put('b', key='event-2') is False
+
+    assert len(diskq) == 3
+    assert [diskq.get() for i in range(3)] == ['a', 'b', 'c']
+    remove_queue(queue)
+
+
+def test_put_without_key_is_never_deduplicated():
+    cache_size = 2
+    queue = 'testq'
+    datadir = './'
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size, dedup_window=10)
+
+    for i in range(5):
+        diskq.put('a')
+
+    assert len(diskq) == 5
+    remove_queue(queue)
+
+
+def test_put_with_key_requires_dedup_window():
+    cache_size = 2
+    queue = 'testq'
+    datadir = './'
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size)
+
+    with pytest.raises(ValueError):
+        diskq.put('a', key='event-1')
+    remove_queue(queue)
+
+
+def test_duplicate_accepted_after_window_expires():
+    cache_size = 1
+    queue = 'testq'
+    datadir = './'
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size, dedup_window=3)
+
+    diskq.put(0, key=0)
+    for i in range(1, 6):
+        diskq.put(i, key=i)
+
+    assert diskq.put(0, key=0) is True
+    assert diskq.put(5, key=5) is False
+    remove_queue(queue)
+
+
+def test_keys_survive_restart():
+    cache_size = 2
+    queue = 'testq'
+    datadir = './'
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size, dedup_window=100)
+
+    for i in range(5):
+        diskq.put(i, key=f'event-{i}')
+    diskq.sync()
+    diskq.close()
+
+    assert os.path.exists(os.path.join(datadir, queue, 'keys'))
+
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size, dedup_window=100)
+    for i in range(5):
+        assert diskq.put(i, key=f'event-{i}') is False
+    assert diskq.put(5, key='event-5') is True
+    remove_queue(queue)
+
+
+def test_key_index_resized_when_window_changes():
+    queue = 'testq'
+    os.mkdir(queue)
+    file_name = os.path.join(queue, 'keys')
+
+    index = KeyIndex(file_name, window=4)
+    for i in range(4):
+        index.record(key_hash(i))
+    index.commit()
+    index.close()
+
+    index = KeyIndex(file_name, window=1000)
+    assert all(index.seen(key_hash(i)) for i in range(4))
+    assert not index.seen(key_hash(4))
+    index.close()
+    remove_queue(queue)
+
+
+def test_key_index_opens_without_scanning(monkeypatch):
+    queue = 'testq'
+    os.mkdir(queue)
+    file_name = os.path.join(queue, 'keys')
+
+    index = KeyIndex(file_name, window=10)
+    for i in range(25):
+        index.record(key_hash(i))
+        index.commit()
+    index.close()
+
+    monkeypatch.setattr(KeyIndex, '_scan', None)
+    index = KeyIndex(file_name, window=10)
+    assert all(index.seen(key_hash(i)) for i in range(15, 25))
+    assert not any(index.seen(key_hash(i)) for i in range(15))
+    index.close()
+    monkeypatch.undo()
+
+    # Lost filters are rebuilt from the table, a slice at a time.
+    os.remove(file_name + '.bloom')
+    monkeypatch.setattr(KeyIndex, 'SCAN_SLOTS', 3)
+    index = KeyIndex(file_name, window=10)
+    assert all(index.seen(key_hash(i)) for i in range(15, 25))
+    assert not any(index.seen(key_hash(i)) for i in range(15))
+    index.close()
+    remove_queue(queue)
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(64)
+    hashes = [key_hash(i) for i in range(200)]
+    for h in hashes:
+        bloom.add(h)
+
+    assert all(h in bloom for h in hashes)
@@ -0,0 +1,86 @@
+from DiskQueue import DiskQueue
+from DiskQueue import chunk_io
+import os
+import pytest
+import shutil
+
+
+def remove_queue(queue):
+    shutil.rmtree(queue)
+
+
+@pytest.mark.parametrize('io_mode', chunk_io.IO_MODES)
+def test_get_put_with_io_mode(io_mode):
+    cache_size = 4
+    objects = range(30)
+    queue = 'testq'
+    datadir = './'
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size, io_mode=io_mode)
+
+    for i in objects:
+        diskq.put({'a': i})
+
+    for i in objects:
+        assert diskq.get() == {'a': i}
+    remove_queue(queue)
+
+
+@pytest.mark.parametrize('io_mode', [chunk_io.PREALLOCATED, chunk_io.DIRECT])
+def test_aligned_chunk_files_are_padded_to_block_size(io_mode):
+    cache_size = 2
+    queue = 'testq'
+    datadir = './'
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size, io_mode=io_mode)
+
+    for i in range(3):
+        diskq.put(i)
+
+    chunk_file = os.path.join(datadir, queue, '0')
+    assert os.path.getsize(chunk_file) % chunk_io.BLOCK_SIZE == 0
+    remove_queue(queue)
+
+
+@pytest.mark.parametrize('io_mode', [chunk_io.PREALLOCATED, chunk_io.DIRECT])
+def test_consumed_chunk_files_are_reused(io_mode):
+    cache_size = 2
+    queue = 'testq'
+    datadir = './'
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size, io_mode=io_mode)
+
+    for i in range(3):
+        diskq.put(i)
+    inode = os.stat(os.path.join(datadir, queue, '0')).st_ino
+    assert diskq.get() == 0
+
+    # Chunk 1 is written over the blocks of the consumed chunk 0.
+    for i in range(3, 5):
+        diskq.put(i)
+    assert os.stat(os.path.join(datadir, queue, '1')).st_ino == inode
+    assert not os.path.exists(os.path.join(datadir, queue, 'spare0'))
+
+    assert [diskq.get() for i in range(4)] == [1, 2, 3, 4]
+    remove_queue(queue)
+
+
+@pytest.mark.parametrize('io_mode', chunk_io.IO_MODES)
+def test_queue_recover_with_io_mode(io_mode):
+    cache_size = 2
+    queue = 'testq'
+    datadir = './'
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size, io_mode=io_mode)
+
+    for i in range(5):
+        diskq.put(i)
+    diskq.sync()
+
+    # Padded chunks are readable regardless of the mode the queue is reopened with.
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size)
+
+    for i in range(5):
+        assert diskq.get() == i
+    remove_queue(queue)
+
+
+def test_invalid_io_mode_raises_value_error():
+    with pytest.raises(ValueError):
+        DiskQueue(path='./', queue_name='testq', cache_size=2, io_mode='mmap')
@@ -0,0 +1,123 @@
+from DiskQueue import DiskQueue, WorkerPool
+from DiskQueue.exceptions import Empty
+from concurrent.futures import BrokenExecutor
+import os
+import pytest
+import shutil
+import threading
+
+
+def remove_queue(queue):
+    shutil.rmtree(queue)
+
+
+def square(obj):
+    return obj * obj
+
+
+def fail(obj):
+    raise RuntimeError(obj)
+
+
+def test_get_many_returns_available_objects():
+    cache_size = 3
+    queue = 'testq'
+    datadir = './'
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size)
+
+    for i in range(10):
+        diskq.put(i)
+
+    assert diskq.get_many(4) == [0, 1, 2, 3]
+    assert diskq.get_many(100) == [4, 5, 6, 7, 8, 9]
+    with pytest.raises(Empty):
+        diskq.get_many(4, block=False)
+    remove_queue(queue)
+
+
+def test_thread_pool_processes_every_item():
+    cache_size = 5
+    queue = 'testq'
+    datadir = './'
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size)
+
+    seen = []
+    lock = threading.Lock()
+
+    def consume(obj):
+        with lock:
+            seen.append(obj)
+
+    for i in range(50):
+        diskq.put(i)
+
+    with WorkerPool(diskq, consume, workers=2, batch_size=4, executor='thread') as pool:
+        pool.join()
+
+    assert sorted(seen) == list(range(50))
+    assert pool.stats()['items'] == 50
+    assert pool.stats()['in_flight'] == 0
+    remove_queue(queue)
+
+
+def test_process_pool_processes_every_item():
+    cache_size = 5
+    queue = 'testq'
+    datadir = './'
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size)
+
+    for i in range(40):
+        diskq.put(i)
+
+    with WorkerPool(diskq, square, workers=2, batch_size=8, max_in_flight=2) as pool:
+        pool.join()
+
+    stats = pool.stats()
+    assert stats['items'] == 40
+    assert stats['batches'] >= 5
+    assert stats['failed_batches'] == 0
+    assert diskq.empty()
+    remove_queue(queue)
+
+
+def test_failed_batches_are_counted_and_acked():
+    cache_size = 5
+    queue = 'testq'
+    datadir = './'
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size)
+
+    for i in range(6):
+        diskq.put(i)
+
+    with WorkerPool(diskq, fail, workers=1, batch_size=3, executor='thread') as pool:
+        pool.join()
+
+    assert pool.stats()['failed_batches'] == 2
+    assert diskq.unfinished_tasks == 0
+    remove_queue(queue)
+
+
+def crash(obj):
+    os._exit(1)
+
+
+def test_broken_process_pool_stops_cleanly():
+    cache_size = 5
+    queue = 'testq'
+    datadir = './'
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size)
+
+    for i in range(40):
+        diskq.put(i)
+
+    pool = WorkerPool(diskq, crash, workers=1, batch_size=4, max_in_flight=2, poll_interval=0.05).start()
+    with pytest.raises(BrokenExecutor):
+        pool.join()
+    pool.stop()
+
+    stats = pool.stats()
+    assert stats['failed_batches'] >= 1
+    assert stats['in_flight'] == 0
+    assert stats['items'] + len(diskq) == 40
+    assert diskq.unfinished_tasks == len(diskq)
+    remove_queue(queue)
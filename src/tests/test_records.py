@@ -0,0 +1,135 @@
+from DiskQueue import DiskQueue, ChunkCache
+from DiskQueue import chunk_io
+import pytest
+import shutil
+
+
+def remove_queue(queue):
+    shutil.rmtree(queue)
+
+
+def test_struct_records_put_get():
+    cache_size = 3
+    queue = 'testq'
+    datadir = './'
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size, record_format='<qd')
+
+    for i in range(10):
+        diskq.put((i, i / 2))
+
+    assert len(diskq) == 10
+    assert diskq.peek(2) == [(0, 0.0), (1, 0.5)]
+    for i in range(10):
+        assert diskq.get() == (i, i / 2)
+    assert diskq.empty()
+    remove_queue(queue)
+
+
+def test_struct_records_get_many_spans_chunks():
+    cache_size = 3
+    queue = 'testq'
+    datadir = './'
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size, record_format='<ii')
+
+    for i in range(10):
+        diskq.put((i, -i))
+
+    assert diskq.get() == (0, 0)
+    assert diskq.get_many(7) == [(i, -i) for i in range(1, 8)]
+    assert diskq.get_many(7) == [(8, -8), (9, -9)]
+    remove_queue(queue)
+
+
+@pytest.mark.parametrize('io_mode', chunk_io.IO_MODES)
+def test_struct_records_recover(io_mode):
+    cache_size = 4
+    queue = 'testq'
+    datadir = './'
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size, record_format='<Hf',
+                      io_mode=io_mode)
+
+    for i in range(9):
+        diskq.put((i, 1.5))
+    diskq.get()
+    diskq.sync()
+
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size, record_format='<Hf')
+    assert len(diskq) == 8
+    assert [diskq.get() for i in range(8)] == [(i, 1.5) for i in range(1, 9)]
+    remove_queue(queue)
+
+
+def test_records_through_chunk_cache():
+    cache_size = 2
+    queue = 'testq'
+    datadir = './'
+    cache = ChunkCache(budget_bytes=64)
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size, record_format='<q',
+                      chunk_cache=cache)
+
+    for i in range(20):
+        diskq.put((i,))
+
+    assert cache.stats()['spills'] > 0
+    assert diskq.get_many(20) == [(i,) for i in range(20)]
+    remove_queue(queue)
+
+
+def test_chunk_with_other_record_format_is_rejected():
+    cache_size = 2
+    queue = 'testq'
+    datadir = './'
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size, record_format='<q')
+
+    for i in range(3):
+        diskq.put((i,))
+    diskq.sync()
+
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size, record_format='<i')
+    with pytest.raises(ValueError):
+        diskq.get()
+    remove_queue(queue)
+
+
+def test_numpy_records_get_many_returns_array():
+    numpy = pytest.importorskip('numpy')
+
+    cache_size = 4
+    queue = 'testq'
+    datadir = './'
+    dtype = numpy.dtype([('ts', '<i8'), ('value', '<f8')])
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size, record_format=dtype)
+
+    for i in range(10):
+        diskq.put((i, i * 0.25))
+
+    assert diskq.get() == (0, 0.0)
+
+    batch = diskq.get_many(6)
+    assert isinstance(batch, numpy.ndarray)
+    assert batch.dtype == dtype
+    assert list(batch['ts']) == list(range(1, 7))
+    assert list(batch['value']) == [i * 0.25 for i in range(1, 7)]
+
+    assert len(diskq.get_many(10)) == 3
+    remove_queue(queue)
+
+
+def test_numpy_records_peek_returns_tuples():
+    numpy = pytest.importorskip('numpy')
+
+    cache_size = 2
+    queue = 'testq'
+    datadir = './'
+    dtype = numpy.dtype([('ts', '<i8'), ('value', '<f8')])
+    diskq = DiskQueue(path=datadir, queue_name=queue, cache_size=cache_size, record_format=dtype)
+
+    for i in range(5):
+        diskq.put((i, i * 0.5))
+
+    # Spans the get buffer, a chunk file & the put buffer.
+    assert diskq.peek() == (0, 0.0)
+    assert diskq.peek(5) == [(i, i * 0.5) for i in range(5)]
+    assert all(type(obj) is tuple for obj in diskq.peek(5))
+    assert diskq.get() == (0, 0.0)
+    remove_queue(queue)
@@ -0,0 +1,119 @@
+from DiskQueue import DiskQueue, QueueSelector
+from DiskQueue.exceptions import Empty
+import pytest
+import shutil
+import threading
+import time
+
+
+def remove_queue(queue):
+    shutil.rmtree(queue)
+
+
+def make_queues(names, cache_size=4):
+    return [DiskQueue(path='./', queue_name=name, cache_size=cache_size) for name in names]
+
+
+def test_select_returns_batches_from_non_empty_queues():
+    q1, q2 = make_queues(['testq1', 'testq2'])
+    selector = QueueSelector([q1, q2])
+
+    for i in range(3):
+        q2.put(i)
+
+    queue, objects = selector.select(max_items=10)
+    assert queue is q2
+    assert objects == [0, 1, 2]
+
+    with pytest.raises(Empty):
+        selector.select(block=False)
+
+    remove_queue('testq1')
+    remove_queue('testq2')
+
+
+def test_weighted_round_robin_shares_consumption():
+    heavy, light = make_queues(['heavyq', 'lightq'])
+    selector = QueueSelector()
+    selector.register(heavy, weight=3)
+    selector.register(light, weight=1)
+
+    for i in range(100):
+        heavy.put(i)
+        light.put(i)
+
+    picked = [selector.select()[0] for i in range(40)]
+    assert picked.count(heavy) == 30
+    assert picked.count(light) == 10
+
+    remove_queue('heavyq')
+    remove_queue('lightq')
+
+
+def test_backlogged_queue_does_not_starve_others():
+    backlog, small = make_queues(['backlogq', 'smallq'])
+    selector = QueueSelector([backlog, small])
+
+    for i in range(1000):
+        backlog.put(i)
+    for i in range(3):
+        small.put(i)
+
+    picked = [selector.select(max_items=5)[0] for i in range(6)]
+    assert picked.count(small) == 1
+    assert small.empty()
+
+    remove_queue('backlogq')
+    remove_queue('smallq')
+
+
+def test_rate_limited_queue():
+    limited, = make_queues(['limitedq'])
+    selector = QueueSelector()
+    selector.register(limited, rate=20, burst=2)
+
+    for i in range(10):
+        limited.put(i)
+
+    queue, objects = selector.select(max_items=10)
+    assert objects == [0, 1]
+    with pytest.raises(Empty):
+        selector.select(block=False)
+
+    # The next token is available after 1 / rate seconds.
+    start = time.monotonic()
+    queue, objects = selector.select(timeout=2)
+    assert objects == [2]
+    assert time.monotonic() - start >= 0.03
+
+    remove_queue('limitedq')
+
+
+def test_select_wakes_up_on_put():
+    q1, q2 = make_queues(['testq1', 'testq2'])
+    selector = QueueSelector([q1, q2])
+
+    timer = threading.Timer(0.05, q2.put, args=('late',))
+    timer.start()
+
+    start = time.monotonic()
+    queue, objects = selector.select(timeout=5)
+    assert queue is q2
+    assert objects == ['late']
+    assert time.monotonic() - start < 1
+
+    timer.join()
+    selector.close()
+    assert q1._listeners == []
+    remove_queue('testq1')
+    remove_queue('testq2')
+
+
+def test_select_timeout_raises_empty():
+    q1, = make_queues(['testq1'])
+    selector = QueueSelector([q1])
+
+    with pytest.raises(Empty):
+        selector.select(timeout=0.05)
+
+    remove_queue('testq1')
@@ -0,0 +1,213 @@
+from DiskQueue import DiskQueue, WorkerPool
+from DiskQueue.exceptions import Empty, Full
+import functools
+import os
+import pytest
+import shutil
+import threading
+import time
+
+
+# Throughput floors are divided by this factor, raise it on slow machines.
+PERF_SCALE = float(os.environ.get('DISKQUEUE_PERF_SCALE', '1'))
+
+
+def remove_queue(queue):
+    shutil.rmtree(queue)
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def run_producers_consumers(diskq, producers, consumers, items, batch=None):
+    got = []
+    got_lock = threading.Lock()
+    done = threading.Event()
+
+    def producer(producer_id):
+        for i in range(items):
+            diskq.put((producer_id, i), timeout=5)
+
+    def consumer():
+        while not done.is_set() or not diskq.empty():
+            try:
+                if batch:
+                    objects = diskq.get_many(batch, timeout=0.05)
+                else:
+                    objects = [diskq.get(timeout=0.05)]
+            except Empty:
+                continue
+            with got_lock:
+                got.extend(tuple(obj) for obj in objects)
+            for obj in objects:
+                diskq.task_done()
+
+    producer_threads = [threading.Thread(target=producer, args=(i,)) for i in range(producers)]
+    consumer_threads = [threading.Thread(target=consumer) for i in range(consumers)]
+    for thread in producer_threads + consumer_threads:
+        thread.start()
+    for thread in producer_threads:
+        thread.join()
+    diskq.join()
+    done.set()
+    for thread in consumer_threads:
+        thread.join()
+    return got
+
+
+def assert_exactly_once(got, producers, items):
+    assert len(got) == producers * items
+    assert set(got) == {(p, i) for p in range(producers) for i in range(items)}
+
+
+@pytest.mark.parametrize('batch', [None, 16])
+def test_many_producers_and_consumers(batch):
+    queue = 'stressq'
+    diskq = DiskQueue(path='./', queue_name=queue, cache_size=7)
+
+    got = run_producers_consumers(diskq, producers=6, consumers=6, items=300, batch=batch)
+
+    assert_exactly_once(got, 6, 300)
+    assert diskq.empty()
+    assert diskq.unfinished_tasks == 0
+    remove_queue(queue)
+
+
+def test_many_producers_and_consumers_with_max_size():
+    queue = 'stressq'
+    diskq = DiskQueue(path='./', queue_name=queue, cache_size=5, max_size=20)
+
+    got = run_producers_consumers(diskq, producers=4, consumers=2, items=200)
+
+    assert_exactly_once(got, 4, 200)
+    remove_queue(queue)
+
+
+def record_item(file_name, obj):
+    # Runs in a worker process, a single short O_APPEND write per item.
+    with open(file_name, 'a') as fp:
+        fp.write(f'{obj[0]} {obj[1]}\n')
+
+
+def test_producers_with_process_consumers():
+    queue = 'stressq'
+    diskq = DiskQueue(path='./', queue_name=queue, cache_size=7)
+    results = os.path.join(queue, 'results')
+
+    def producer(producer_id):
+        for i in range(300):
+            diskq.put((producer_id, i))
+
+    pool = WorkerPool(diskq, functools.partial(record_item, results), workers=3, batch_size=16)
+    with pool:
+        producers = [threading.Thread(target=producer, args=(i,)) for i in range(4)]
+        for thread in producers:
+            thread.start()
+        for thread in producers:
+            thread.join()
+        pool.join()
+
+    with open(results) as fp:
+        got = [tuple(int(x) for x in line.split()) for line in fp]
+    assert_exactly_once(got, 4, 300)
+    assert pool.stats()['failed_batches'] == 0
+    remove_queue(queue)
+
+
+def test_put_timeout_raises_full():
+    queue = 'stressq'
+    diskq = DiskQueue(path='./', queue_name=queue, cache_size=5, max_size=1)
+    diskq.put(0)
+
+    start = time.monotonic()
+    with pytest.raises(Full):
+        diskq.put(1, timeout=0.05)
+    assert time.monotonic() - start >= 0.05
+
+    # A get() from another thread frees the slot before the timeout expires.
+    threading.Timer(0.05, diskq.get).start()
+    diskq.put(1, timeout=5)
+    assert diskq.get() == 1
+    remove_queue(queue)
+
+
+def test_task_done_and_join():
+    queue = 'stressq'
+    diskq = DiskQueue(path='./', queue_name=queue, cache_size=5)
+
+    for i in range(3):
+        diskq.put(i)
+    for i in range(3):
+        diskq.get()
+        diskq.task_done()
+
+    diskq.join()
+    assert diskq.unfinished_tasks == 0
+    with pytest.raises(ValueError):
+        diskq.task_done()
+    remove_queue(queue)
+
+
+def test_put_get_throughput(record_property):
+    queue = 'perfq'
+    items = 20000
+    diskq = DiskQueue(path='./', queue_name=queue, cache_size=1000)
+
+    start = time.perf_counter()
+    for i in range(items):
+        diskq.put(i)
+    put_rate = items / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for i in range(items):
+        diskq.get()
+    get_rate = items / (time.perf_counter() - start)
+
+    record_property('put_per_sec', round(put_rate))
+    record_property('get_per_sec', round(get_rate))
+
+    assert put_rate > 10000 / PERF_SCALE
+    assert get_rate > 10000 / PERF_SCALE
+    remove_queue(queue)
+
+
+def test_contended_latency_and_lock_free_size(record_property):
+    queue = 'perfq'
+    diskq = DiskQueue(path='./', queue_name=queue, cache_size=500)
+    latencies = []
+    stop = threading.Event()
+    size_reads = [0]
+
+    def producer():
+        for i in range(2000):
+            start = time.perf_counter()
+            diskq.put(i)
+            latencies.append(time.perf_counter() - start)
+
+    def monitor():
+        # qsize() must never block behind put() / get().
+        while not stop.is_set():
+            diskq.qsize()
+            size_reads[0] += 1
+
+    monitor_thread = threading.Thread(target=monitor)
+    monitor_thread.start()
+    producers = [threading.Thread(target=producer) for i in range(4)]
+    for thread in producers:
+        thread.start()
+    for thread in producers:
+        thread.join()
+    stop.set()
+    monitor_thread.join()
+
+    p50, p99 = percentile(latencies, 0.5), percentile(latencies, 0.99)
+    record_property('put_p50_ms', round(p50 * 1000, 3))
+    record_property('put_p99_ms', round(p99 * 1000, 3))
+    record_property('qsize_reads', size_reads[0])
+
+    assert len(diskq) == 8000
+    assert size_reads[0] > 0
+    assert p99 < 0.25 * PERF_SCALE
+    remove_queue(queue)
@@ -0,0 +1,233 @@
+from DiskQueue import DiskQueue, ChunkCache
+from DiskQueue.wal import WriteAheadLog
+import os
+import pytest
+import shutil
+import threading
+
+
+def remove_queue(queue):
+    shutil.rmtree(queue)
+
+
+def reopen(queue, cache_size, **kwargs):
+    # The previous instance is dropped without sync() / close(), as in a crash.
+    return DiskQueue(path='./', queue_name=queue, cache_size=cache_size, wal=True, **kwargs)
+
+
+def drain(diskq):
+    # get_many() on a wal queue stops at the end of the chunk being consumed.
+    objects = []
+    while not diskq.empty():
+        objects.extend(diskq.get_many(1000))
+    return objects
+
+
+def test_buffered_puts_survive_crash():
+    cache_size = 10
+    queue = 'testq'
+    diskq = reopen(queue, cache_size)
+
+    for i in range(3):
+        diskq.put(i)
+
+    diskq = reopen(queue, cache_size)
+    assert len(diskq) == 3
+    assert [diskq.get() for i in range(3)] == [0, 1, 2]
+    remove_queue(queue)
+
+
+def test_flushed_chunks_are_not_replayed_twice():
+    cache_size = 2
+    queue = 'testq'
+    diskq = reopen(queue, cache_size)
+
+    for i in range(5):
+        diskq.put(i)
+
+    diskq = reopen(queue, cache_size)
+    assert len(diskq) == 5
+    assert [diskq.get() for i in range(5)] == list(range(5))
+    assert diskq.empty()
+    remove_queue(queue)
+
+
+def test_consumed_items_are_not_replayed():
+    cache_size = 10
+    queue = 'testq'
+    diskq = reopen(queue, cache_size)
+
+    diskq.put(0)
+    diskq.put(1)
+    assert diskq.get() == 0
+    diskq.put(2)
+
+    diskq = reopen(queue, cache_size)
+    assert len(diskq) == 2
+    assert [diskq.get() for i in range(2)] == [1, 2]
+    remove_queue(queue)
+
+
+def test_unconsumed_chunk_items_survive_crash():
+    cache_size = 3
+    queue = 'testq'
+    diskq = reopen(queue, cache_size)
+
+    for i in range(7):
+        diskq.put(i)
+    assert diskq.get() == 0
+    assert diskq.get_many(2) == [1, 2]
+    assert diskq.get() == 3
+
+    diskq = reopen(queue, cache_size)
+    assert len(diskq) == 3
+    assert diskq.get_many(10) == [4, 5]
+    assert diskq.get_many(10) == [6]
+
+    diskq = reopen(queue, cache_size)
+    assert diskq.empty()
+    remove_queue(queue)
+
+
+def test_put_buffer_is_handed_over_in_the_log():
+    cache_size = 100
+    queue = 'testq'
+    diskq = reopen(queue, cache_size)
+
+    # A consumer keeping pace with the producer never writes a chunk.
+    for i in range(50):
+        diskq.put(i)
+        assert diskq.get() == i
+    for i in range(50, 53):
+        diskq.put(i)
+    assert diskq.get() == 50
+    diskq.put(53)
+    assert not os.path.exists(os.path.join(queue, '0'))
+
+    diskq = reopen(queue, cache_size)
+    assert len(diskq) == 3
+    assert drain(diskq) == [51, 52, 53]
+    remove_queue(queue)
+
+
+def test_log_is_compacted_while_draining(monkeypatch):
+    monkeypatch.setattr(WriteAheadLog, 'COMPACT_BYTES', 4096)
+    cache_size = 10
+    queue = 'testq'
+    diskq = reopen(queue, cache_size)
+
+    for i in range(500):
+        diskq.put(i)
+    for i in range(500):
+        assert diskq.get() == i
+        assert os.path.getsize(os.path.join(queue, 'wal')) <= 2 * 4096 + 64
+
+    diskq = reopen(queue, cache_size)
+    assert diskq.empty()
+    remove_queue(queue)
+
+
+def test_replayed_keys_are_still_deduplicated():
+    cache_size = 10
+    queue = 'testq'
+    diskq = reopen(queue, cache_size, dedup_window=100)
+
+    assert diskq.put('a', key='k1')
+
+    diskq = reopen(queue, cache_size, dedup_window=100)
+    assert not diskq.put('a', key='k1')
+    assert len(diskq) == 1
+    remove_queue(queue)
+
+
+def test_keys_of_consumed_items_survive_crash():
+    cache_size = 10
+    queue = 'testq'
+    diskq = reopen(queue, cache_size, dedup_window=100)
+
+    assert diskq.put('a', key='k1')
+    assert diskq.put('b', key='k2')
+    assert diskq.get() == 'a'
+
+    # Dropped without close(), 'a' was handed out of the put buffer.
+    diskq = reopen(queue, cache_size, dedup_window=100)
+    assert len(diskq) == 1
+    assert not diskq.put('a', key='k1')
+    assert not diskq.put('b', key='k2')
+    remove_queue(queue)
+
+
+def test_wal_rejects_chunk_cache():
+    with pytest.raises(ValueError):
+        reopen('testq', 10, chunk_cache=ChunkCache(1024))
+    assert not os.path.exists('testq')
+
+
+def test_sync_truncates_wal():
+    cache_size = 10
+    queue = 'testq'
+    diskq = reopen(queue, cache_size)
+
+    for i in range(3):
+        diskq.put(i)
+    diskq.sync()
+
+    diskq = reopen(queue, cache_size)
+    assert [diskq.get() for i in range(3)] == [0, 1, 2]
+    assert diskq.empty()
+    remove_queue(queue)
+
+
+def test_torn_record_is_dropped_on_replay():
+    cache_size = 10
+    queue = 'testq'
+    diskq = reopen(queue, cache_size)
+
+    diskq.put('a')
+    diskq.put('b')
+
+    # A crash in the middle of appending the next record.
+    with open(os.path.join(queue, 'wal'), 'ab') as fp:
+        fp.write(b'\x10\x00\x00\x00\x00')
+
+    diskq = reopen(queue, cache_size)
+    assert len(diskq) == 2
+    diskq.put('c')
+
+    diskq = reopen(queue, cache_size)
+    assert [diskq.get() for i in range(3)] == ['a', 'b', 'c']
+    remove_queue(queue)
+
+
+def test_concurrent_puts_are_all_logged():
+    cache_size = 7
+    queue = 'testq'
+    diskq = reopen(queue, cache_size)
+
+    def producer(producer_id):
+        for i in range(50):
+            diskq.put((producer_id, i))
+
+    producers = [threading.Thread(target=producer, args=(i,)) for i in range(8)]
+    for thread in producers:
+        thread.start()
+    for thread in producers:
+        thread.join()
+
+    diskq = reopen(queue, cache_size)
+    objects = drain(diskq)
+    assert sorted(map(tuple, objects)) == sorted((p, i) for p in range(8) for i in range(50))
+    remove_queue(queue)
+
+
+def test_typed_records_wal():
+    cache_size = 4
+    queue = 'testq'
+    diskq = reopen(queue, cache_size, record_format='<qd')
+
+    for i in range(6):
+        diskq.put((i, 0.5))
+
+    diskq = reopen(queue, cache_size, record_format='<qd')
+    assert drain(diskq) == [(i, 0.5) for i in range(6)]
+    remove_queue(queue)